@@ -0,0 +1,236 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, fields
+from functools import partial
+
+import numpy as np
+
+from andamento import BPM_MAX, BPM_MIN, rastrear_batidas
+from decodificacao import carregar_de_memoria, decodificar_ffmpeg, decodificavel, usar_ffmpeg
+from metricas import etapa
+from tonalidade import (HOP_RAPIDO, NOTAS, SR_RAPIDO, chroma_cqt_em_blocos, chroma_rapido, estimar_tonalidade,
+                        linha_tonalidades)
+
+# librosa (e com ele numba/scipy/resampy) só é importado quando uma análise é pedida.
+# O numba lê NUMBA_CACHE_DIR ao ser importado, então o diretório precisa estar definido
+# antes disso para reaproveitar os kernels compilados pelo aquecimento (aquecimento.py).
+os.environ.setdefault(
+    "NUMBA_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "numba")
+)
+
+SR_PADRAO = 22050
+DURACAO_PADRAO = 60
+HOP_PADRAO = 512
+# Tempo e tom em paralelo dentro de uma análise: ganha latência com 2+ núcleos livres,
+# mas num pool já com um processo por núcleo só disputa CPU com os vizinhos
+PARALELO_PADRAO = os.environ.get("ANALISE_PARALELO", "").lower() in ("1", "true", "sim")
+
+# ----------------- PERFIS DE ANÁLISE -----------------
+
+@dataclass(frozen=True)
+class PerfilAnalise:
+    nome: str
+    sr: int
+    duracao: float
+    hop_length: int
+    res_type: str
+    chroma_rapida: bool
+
+    def parametros(self):
+        return asdict(self)
+
+# "padrao" reproduz o comportamento original de estimar_bpm_multiplos/estimar_tom
+# (22050 Hz, primeiros 60 s, hop 512, resampler kaiser_best, chroma_cqt).
+# Latência e pico de memória medidos num processo da fila (limites de fila.py aplicados,
+# 1 núcleo) para um WAV estéreo 44.1 kHz de 3 min:
+#   rapido   ~0.3 s,  ~+25 MB  (11025 Hz mono, 30 s, hop 256, resampler polyphase, chroma STFT)
+#   padrao   ~5.5 s,  ~+60 MB  (estimar_bpm_multiplos + estimar_tom em sequência: ~8.5 s)
+#   preciso  ~16-19 s, ~+120 MB (22050 Hz, 180 s, hop 512, kaiser_best, chroma_cqt em blocos);
+#            o kaiser_best de 180 s é ~3/4 do tempo. Hop 256 dobrava o onset (~+180 MB)
+#            sem ganho de acurácia no benchmark
+PERFIS_ANALISE = {
+    "rapido": PerfilAnalise("rapido", sr=11025, duracao=30, hop_length=256,
+                            res_type="polyphase", chroma_rapida=True),
+    "padrao": PerfilAnalise("padrao", sr=SR_PADRAO, duracao=DURACAO_PADRAO, hop_length=HOP_PADRAO,
+                            res_type="kaiser_best", chroma_rapida=False),
+    "preciso": PerfilAnalise("preciso", sr=SR_PADRAO, duracao=180, hop_length=HOP_PADRAO,
+                             res_type="kaiser_best", chroma_rapida=False),
+}
+PERFIL_PADRAO = "padrao"
+
+def obter_perfil(perfil):
+    if isinstance(perfil, PerfilAnalise):
+        return perfil
+    if perfil not in PERFIS_ANALISE:
+        raise ValueError(f"Perfil de análise desconhecido: {perfil} (use {', '.join(PERFIS_ANALISE)})")
+    return PERFIS_ANALISE[perfil]
+
+# ----------------- RESULTADO -----------------
+
+# Versão do que a análise devolve (campos e valores de resumo()); entra na chave do cache,
+# então incrementar invalida os resultados gravados por versões anteriores.
+#   1 original · 2 batidas (grade de batidas) · 3 linha_tom (modulações)
+#   4 candidatos_tempo · 5 tom/tonalidades da faixa inteira por Krumhansl
+#   6 tempo/batidas da faixa inteira a partir dos candidatos (sem tempograma completo)
+#   7 idem nos perfis; preciso com hop 512; chroma_cqt em blocos
+VERSAO_ANALISE = 7
+
+@dataclass
+class ResultadoAnalise:
+    sr: int
+    duracao: float
+    perfil: str = None
+    hop_length: int = HOP_PADRAO
+    bpm_lista: list = field(default_factory=list)
+    tom: str = None
+    tonalidades: list = None
+    tempo: float = None
+    candidatos_tempo: list = None  # [{"bpm", "confianca", "relacao"}] do mais provável ao menos
+    beats: np.ndarray = None
+    onset_env: np.ndarray = None
+    chroma: np.ndarray = None
+    linha_tempo: list = None
+    linha_tom: list = None  # trechos de tonalidade estável (modulações)
+    batidas: list = None  # segundos de cada batida (resumos vindos do cache, sem `beats`)
+
+    def tempos_batidas(self):
+        # Frames do beat_track -> segundos (o que librosa.frames_to_time faz)
+        if self.beats is None:
+            return self.batidas
+        return np.round(np.asarray(self.beats) * self.hop_length / self.sr, 3).tolist()
+
+    def resumo(self):
+        # Apenas os campos serializáveis (cache, CLI, API)
+        return {
+            "sr": self.sr,
+            "duracao": self.duracao,
+            "perfil": self.perfil,
+            "hop_length": self.hop_length,
+            "bpm_lista": self.bpm_lista,
+            "tom": self.tom,
+            "tonalidades": self.tonalidades,
+            "tempo": self.tempo,
+            "candidatos_tempo": self.candidatos_tempo,
+            "linha_tempo": self.linha_tempo,
+            "linha_tom": self.linha_tom,
+            "batidas": self.tempos_batidas(),
+        }
+
+    @classmethod
+    def de_resumo(cls, resumo):
+        # Ignora campos que não existem mais (resumos gravados por outra versão)
+        campos = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in resumo.items() if k in campos})
+
+# ----------------- FUNÇÕES -----------------
+
+def carregar_audio(fonte, sr=SR_PADRAO, duracao=DURACAO_PADRAO, res_type="kaiser_best"):
+    import librosa
+
+    # Decodifica uma única vez em float32 mono; todos os estágios reutilizam o buffer.
+    # Aceita caminho ou o próprio upload em memória (bytes / objeto tipo arquivo).
+    if usar_ffmpeg(fonte):
+        # M4A/AAC: o ffmpeg já entrega mono float32 na taxa do perfil, só a janela analisada
+        with etapa("decodificacao", leitor="ffmpeg"):
+            return decodificar_ffmpeg(fonte, sr, duracao), sr
+
+    # Decodificação e reamostragem separadas (é o que o librosa.load faz por dentro)
+    # para que cada uma tenha sua própria medição.
+    with etapa("decodificacao"):
+        if not isinstance(fonte, (str, os.PathLike)):
+            y, sr_original = carregar_de_memoria(fonte, sr=None, duracao=duracao, dtype=np.float32)
+        else:
+            with decodificavel():
+                y, sr_original = librosa.load(fonte, sr=None, mono=True, duration=duracao, dtype=np.float32)
+    if sr_original != sr:
+        with etapa("reamostragem", res_type=res_type):
+            y = librosa.resample(y, orig_sr=sr_original, target_sr=sr, res_type=res_type)
+    return y, sr
+
+def candidatos_bpm(tempo):
+    bpm_principal = float(np.squeeze(tempo))
+    candidatos = [bpm_principal, bpm_principal / 2, bpm_principal * 2]
+    candidatos_filtrados = [b for b in candidatos if BPM_MIN <= b <= BPM_MAX]
+    return sorted(set(round(b) for b in candidatos_filtrados))
+
+def tom_do_chroma(chroma):
+    chroma_sum = np.sum(chroma, axis=1)
+    return NOTAS[int(chroma_sum.argmax())]
+
+def _ramo_tempo(y, sr, hop_length):
+    import librosa
+
+    # Mesmo envelope que o beat_track calcularia internamente (aggregate=np.median)
+    with etapa("onset"):
+        onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length, aggregate=np.median)
+    with etapa("beat_track"):
+        # bpm dos candidatos: o beat_track não monta o tempograma da janela inteira
+        tempo, beats, candidatos = rastrear_batidas(onset_env, sr, hop_length)
+    return {
+        "onset_env": onset_env,
+        "tempo": float(tempo),
+        "candidatos_tempo": candidatos,
+        "beats": beats,
+        "bpm_lista": candidatos_bpm(tempo),
+    }
+
+def _ramo_tom(y, sr, hop_length, chroma_rapida):
+    if chroma_rapida:
+        with etapa("chroma_stft"):
+            chroma = chroma_rapido(y, sr)
+        sr_chroma, hop_chroma = SR_RAPIDO, HOP_RAPIDO
+    else:
+        with etapa("chroma_cqt"):
+            chroma = chroma_cqt_em_blocos(y, sr, hop_length)
+        sr_chroma, hop_chroma = sr, hop_length
+    with etapa("tonalidade"):
+        # O mesmo chroma serve ao tom global e à linha do tempo de modulações
+        return {
+            "chroma": chroma,
+            "tom": tom_do_chroma(chroma),
+            "tonalidades": estimar_tonalidade(chroma),
+            "linha_tom": linha_tonalidades(chroma, sr_chroma, hop_chroma),
+        }
+
+def analisar_y(y, sr, hop_length=HOP_PADRAO, calcular_tempo=True, calcular_tom=True,
+               chroma_rapida=False, paralelo=None):
+    resultado = ResultadoAnalise(sr=sr, duracao=len(y) / sr, hop_length=hop_length)
+    paralelo = PARALELO_PADRAO if paralelo is None else paralelo
+
+    ramos = []
+    if calcular_tempo:
+        ramos.append(partial(_ramo_tempo, y, sr, hop_length))
+    if calcular_tom:
+        ramos.append(partial(_ramo_tom, y, sr, hop_length, chroma_rapida))
+
+    if paralelo and len(ramos) == 2:
+        # O tom roda numa thread sobre o mesmo buffer enquanto esta faz o tempo. Threads bastam:
+        # FFT do numpy e os kernels do resampy (numba, nogil) soltam o GIL, e nenhum dos ramos
+        # escreve em `y`. copy_context leva junto a coleta de etapas (metricas.coletar_etapas).
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            futuro = executor.submit(contextvars.copy_context().run, ramos[1])
+            partes = [ramos[0](), futuro.result()]
+    else:
+        partes = [ramo() for ramo in ramos]
+
+    for parte in partes:
+        for campo, valor in parte.items():
+            setattr(resultado, campo, valor)
+    return resultado
+
+def analisar_audio(fonte, perfil=PERFIL_PADRAO, calcular_tempo=True, calcular_tom=True, paralelo=None):
+    perfil = obter_perfil(perfil)
+    with etapa("analise", perfil=perfil.nome):
+        y, sr = carregar_audio(fonte, sr=perfil.sr, duracao=perfil.duracao, res_type=perfil.res_type)
+        resultado = analisar_y(y, sr, hop_length=perfil.hop_length, calcular_tempo=calcular_tempo,
+                               calcular_tom=calcular_tom, chroma_rapida=perfil.chroma_rapida,
+                               paralelo=paralelo)
+    resultado.perfil = perfil.nome
+    return resultado
+
+def estimar_bpm_multiplos(caminho_audio):
+    return analisar_audio(caminho_audio, calcular_tom=False).bpm_lista
+
+def estimar_tom(caminho_audio):
+    return analisar_audio(caminho_audio, calcular_tempo=False).tom
@@ -0,0 +1,164 @@
+import os
+from contextlib import ExitStack
+
+import numpy as np
+
+from analise import ResultadoAnalise, candidatos_bpm
+from andamento import candidatos_tempo, rastrear_batidas
+from decodificacao import (FFMPEG, AudioInvalido, arquivo_temporario, caminho_de, como_arquivo, conteudo,
+                           decodificavel, executavel, pcm_ffmpeg)
+from metricas import etapa
+from tonalidade import estimar_tonalidade
+
+FRAME = 2048
+HOP = 512
+FRAMES_POR_BLOCO = 256   # ~3 s a 44.1 kHz por bloco processado
+SEGMENTO_PADRAO = 30.0   # segundos por trecho da linha do tempo
+SR_FFMPEG = 22050        # taxa pedida ao ffmpeg (formatos que o soundfile não lê)
+
+# ----------------- LEITURA EM BLOCOS -----------------
+
+def _pcm_soundfile(arquivo, tamanho):
+    with arquivo:
+        for bloco in arquivo.blocks(blocksize=tamanho, dtype="float32", always_2d=True):
+            yield bloco.mean(axis=1)
+
+def _pcm_audioread(arquivo):
+    with arquivo:
+        for buf in arquivo:
+            amostras = np.frombuffer(buf, dtype="<i2").astype(np.float32) / 32768.0
+            yield amostras.reshape(-1, arquivo.channels).mean(axis=1)
+
+def _pcm_temporario(pilha, arquivo):
+    with pilha:
+        yield from _pcm_audioread(arquivo)
+
+def _pcm_ffmpeg(fonte, tamanho):
+    with caminho_de(fonte) as caminho:
+        yield from pcm_ffmpeg(caminho, SR_FFMPEG, amostras=tamanho)
+
+def abrir_pcm(fonte, tamanho=65536):
+    import audioread
+    import soundfile as sf
+
+    # soundfile lê WAV/FLAC/OGG/MP3 em blocos (de caminho ou buffer); M4A vai para o ffmpeg
+    # (PCM mono por pipe) ou, sem ffmpeg instalado, para o audioread, que só lê de caminho
+    # -> uploads em memória passam por um arquivo temporário em tmpfs
+    em_disco = isinstance(fonte, (str, os.PathLike))
+    try:
+        arquivo = sf.SoundFile(fonte if em_disco else como_arquivo(fonte))
+        return arquivo.samplerate, _pcm_soundfile(arquivo, tamanho)
+    except RuntimeError:
+        if executavel(FFMPEG):
+            return SR_FFMPEG, _pcm_ffmpeg(fonte, tamanho)
+        if em_disco:
+            with decodificavel():
+                arquivo = audioread.audio_open(fonte)
+            return arquivo.samplerate, _pcm_audioread(arquivo)
+    pilha = ExitStack()
+    sufixo = os.path.splitext(getattr(fonte, "name", "") or "")[1]
+    caminho = pilha.enter_context(arquivo_temporario(conteudo(fonte), sufixo))
+    try:
+        with decodificavel():
+            arquivo = audioread.audio_open(caminho)
+    except Exception:
+        pilha.close()
+        raise
+    return arquivo.samplerate, _pcm_temporario(pilha, arquivo)
+
+def blocos_alinhados(pedacos, frame_length=FRAME, hop_length=HOP, frames_por_bloco=FRAMES_POR_BLOCO):
+    # Reagrupa pedaços de tamanho arbitrário em blocos que se sobrepõem em
+    # frame_length - hop_length amostras, mantendo a grade de frames global.
+    tamanho = frame_length + (frames_por_bloco - 1) * hop_length
+    avanco = frames_por_bloco * hop_length
+    buffer = np.zeros(0, dtype=np.float32)
+    algum = False
+    for pedaco in pedacos:
+        buffer = np.concatenate([buffer, pedaco])
+        while len(buffer) >= tamanho:
+            yield buffer[:tamanho]
+            buffer = buffer[avanco:]
+            algum = True
+    if len(buffer) >= frame_length:
+        yield buffer
+    elif len(buffer) and not algum:
+        yield np.pad(buffer, (0, frame_length - len(buffer)))
+
+# ----------------- ANÁLISE CONTÍNUA -----------------
+
+def analisar_audio_continuo(fonte, segmento=SEGMENTO_PADRAO,
+                            frame_length=FRAME, hop_length=HOP, frames_por_bloco=FRAMES_POR_BLOCO):
+    import librosa
+
+    sr, pedacos = abrir_pcm(fonte)
+    amostras = [0]
+
+    def contar(pedacos):
+        for pedaco in pedacos:
+            amostras[0] += len(pedaco)
+            yield pedaco
+
+    frames_segmento = max(1, int(round(segmento * sr / hop_length)))
+
+    envelopes = []               # 1 valor por frame: cresce ~86 floats/s, não com as amostras
+    chroma_segmentos = []        # 12 valores por trecho
+    chroma_total = np.zeros(12)
+    anterior = None              # último frame em dB do bloco anterior (continuidade do fluxo espectral)
+    frames = 0
+
+    # Decodificação, STFT, onset e chroma intercalados bloco a bloco: medidos juntos
+    with etapa("blocos"):
+        for bloco in blocos_alinhados(contar(pedacos), frame_length, hop_length, frames_por_bloco):
+            # Um único STFT por bloco alimenta tanto o onset quanto o chroma
+            S = np.abs(librosa.stft(bloco, n_fft=frame_length, hop_length=hop_length, center=False)) ** 2
+            mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=S, sr=sr, fmax=0.5 * sr), top_db=None)
+            if anterior is None:
+                anterior = mel_db[:, :1]
+            fluxo = np.maximum(0.0, np.diff(np.concatenate([anterior, mel_db], axis=1), axis=1))
+            envelopes.append(np.median(fluxo, axis=0))
+            anterior = mel_db[:, -1:]
+
+            chroma = librosa.feature.chroma_stft(S=S, sr=sr, n_fft=frame_length, tuning=0.0)
+            chroma_total += chroma.sum(axis=1)
+            indices = (frames + np.arange(chroma.shape[1])) // frames_segmento
+            while len(chroma_segmentos) <= indices[-1]:
+                chroma_segmentos.append(np.zeros(12))
+            for i in np.unique(indices):
+                chroma_segmentos[i] += chroma[:, indices == i].sum(axis=1)
+            frames += chroma.shape[1]
+
+    if not frames:
+        raise AudioInvalido("Arquivo de áudio vazio.")
+
+    # O envelope cresce ~86 floats/s; tempo e batidas saem dele sem tempograma da faixa inteira
+    onset_env = np.concatenate(envelopes)
+    with etapa("beat_track"):
+        tempo, beats, candidatos = rastrear_batidas(onset_env, sr, hop_length)
+
+    linha_tempo = []
+    with etapa("linha_tempo"):
+        for i, chroma_seg in enumerate(chroma_segmentos):
+            trecho = onset_env[i * frames_segmento:(i + 1) * frames_segmento]
+            bpm = candidatos_tempo(trecho, sr, hop_length, top=1)
+            linha_tempo.append({
+                "inicio": round(i * frames_segmento * hop_length / sr, 2),
+                "fim": round(min((i + 1) * frames_segmento, frames) * hop_length / sr, 2),
+                "bpm": bpm[0]["bpm"] if bpm else None,
+                "tom": estimar_tonalidade(chroma_seg, top=1)[0][0],
+            })
+
+    # Krumhansl sobre o chroma somado: o argmax de nota cai na quinta (3º harmônico do baixo)
+    tonalidades = estimar_tonalidade(chroma_total)
+
+    return ResultadoAnalise(
+        sr=sr,
+        duracao=amostras[0] / sr,
+        bpm_lista=candidatos_bpm(tempo),
+        tom=tonalidades[0][0].split()[0],
+        tonalidades=tonalidades,
+        tempo=float(np.squeeze(tempo)),
+        candidatos_tempo=candidatos,
+        beats=beats,
+        onset_env=onset_env,
+        linha_tempo=linha_tempo,
+    )
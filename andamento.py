@@ -0,0 +1,119 @@
+import numpy as np
+
+BPM_MIN = 40
+BPM_MAX = 240
+BPM_CENTRAL = 120.0   # prior log-normal centrado aqui, 1 oitava de desvio (como o librosa)
+MAX_PICOS = 4         # picos da autocorrelação considerados além das relações métricas
+JANELA_TEMPOGRAMA = 384   # frames por janela (~8.9 s a 22050 Hz / hop 512, como o librosa)
+PASSO_TEMPOGRAMA = 32     # frames entre janelas (o librosa usa 1: mesma média, 32x menos FFTs)
+TOLERANCIA_RELACAO = 0.02 # candidatos a menos de 2% um do outro são o mesmo andamento
+LOTE_TEMPOGRAMA = 256     # janelas por FFT em lote: a memória não cresce com a duração
+
+# Relações métricas avaliadas a partir do pico principal: metade/dobro (oitavas)
+# e 2/3 / 3/2 (compassos compostos, ex.: 6/8 lido como 3 ou 2 tempos)
+RELACOES = {"½": 0.5, "2×": 2.0, "⅔": 2.0 / 3.0, "3/2": 1.5}
+
+# ----------------- AUTOCORRELAÇÃO -----------------
+
+def autocorrelacao_onset(onset_env, janela=JANELA_TEMPOGRAMA, passo=PASSO_TEMPOGRAMA, lote=LOTE_TEMPOGRAMA):
+    # Tempograma de autocorrelação (janelas de Hann sobre o envelope) resumido pela média
+    # entre janelas. As janelas passam pelo FFT em lotes de tamanho fixo e só a soma é
+    # guardada: o tempograma inteiro (janela x frames) nunca existe na memória.
+    # A janela de Hann faz a autocorrelação decair com o lag, como no tempograma do librosa
+    env = np.asarray(onset_env, dtype=float)
+    if len(env) < 2:
+        # Clipe curto demais para haver qualquer lag
+        return np.zeros(0)
+    janela = max(2, min(janela, len(env)))
+    quadros = np.lib.stride_tricks.sliding_window_view(env, janela)[::max(1, passo)]
+    hann = np.hanning(janela)
+    nfft = 1 << int(np.ceil(np.log2(2 * janela)))
+    soma = np.zeros(janela)
+    for inicio in range(0, len(quadros), lote):
+        espectro = np.fft.rfft(quadros[inicio:inicio + lote] * hann, nfft, axis=1)
+        acf = np.fft.irfft(np.abs(espectro) ** 2, nfft, axis=1)[:, :janela]
+        # Cada janela normalizada pelo próprio lag 0 (trechos altos não dominam a média)
+        zero = acf[:, :1]
+        soma += np.divide(acf, zero, out=np.zeros_like(acf), where=zero > 0).sum(axis=0)
+    return soma / len(quadros)
+
+def prior_tempo(bpm):
+    return np.exp(-0.5 * np.log2(np.asarray(bpm) / BPM_CENTRAL) ** 2)
+
+def pico_parabolico(valores, i):
+    # Posição fracionária do pico pela parábola que passa pelos 3 pontos em torno de i
+    if 0 < i < len(valores) - 1:
+        a, b, c = valores[i - 1], valores[i], valores[i + 1]
+        curvatura = a - 2 * b + c
+        if curvatura < 0:
+            return i + 0.5 * (a - c) / curvatura
+    return float(i)
+
+# ----------------- CANDIDATOS -----------------
+
+def candidatos_tempo(onset_env, sr, hop_length, bpm_min=BPM_MIN, bpm_max=BPM_MAX, top=5):
+    # [{"bpm", "confianca", "relacao"}, ...] do mais para o menos provável.
+    # Saliência de um andamento = autocorrelação no lag correspondente x prior;
+    # confiança = saliência / soma das saliências dos candidatos listados
+    acf = autocorrelacao_onset(onset_env)
+    por_minuto = 60.0 * sr / hop_length
+    lag_min = max(1, int(np.ceil(por_minuto / bpm_max)))
+    lag_max = min(len(acf) - 2, int(np.ceil(por_minuto / bpm_min)))
+    if lag_max <= lag_min:
+        return []
+
+    lags = np.arange(lag_min, lag_max + 1)
+    saliencia = np.maximum(acf[lags], 0.0) * prior_tempo(por_minuto / lags)
+    if not np.any(saliencia > 0):
+        # Silêncio ou envelope sem periodicidade: não há andamento para sugerir
+        return []
+    eh_pico = np.r_[False, (saliencia[1:-1] > saliencia[:-2]) & (saliencia[1:-1] >= saliencia[2:]), False]
+    picos = np.flatnonzero(eh_pico)
+    if not len(picos):
+        picos = np.array([int(np.argmax(saliencia))])
+    picos = picos[np.argsort(saliencia[picos])[::-1][:MAX_PICOS]]
+
+    # Lag decimal de cada pico (interpolação parabólica); o primeiro é o principal
+    lags_pico = lags[0] + np.array([pico_parabolico(saliencia, int(i)) for i in picos])
+    bpms = [por_minuto / lag for lag in lags_pico]
+    relacoes = ["principal"] + [None] * (len(bpms) - 1)
+    for relacao, fator in RELACOES.items():
+        bpm = bpms[0] * fator
+        if not bpm_min <= bpm <= bpm_max:
+            continue
+        proximo = int(np.argmin([abs(b / bpm - 1) for b in bpms]))
+        if abs(bpms[proximo] / bpm - 1) <= TOLERANCIA_RELACAO:
+            # Já é um pico: fica o valor medido, ganha o rótulo da relação
+            relacoes[proximo] = relacoes[proximo] or relacao
+        else:
+            bpms.append(bpm)
+            relacoes.append(relacao)
+
+    bpms = np.array(bpms)
+    pontos = np.maximum(np.interp(por_minuto / bpms, np.arange(len(acf)), acf), 0.0) * prior_tempo(bpms)
+    total = pontos.sum()
+    if total <= 0:
+        return []
+    confianca = pontos / total
+    ordem = np.argsort(-confianca, kind="stable")[:top]
+    return [
+        {"bpm": round(float(bpms[i]), 1), "confianca": round(float(confianca[i]), 2), "relacao": relacoes[i]}
+        for i in ordem
+    ]
+
+# ----------------- BATIDAS -----------------
+
+def rastrear_batidas(onset_env, sr, hop_length):
+    # (tempo, frames das batidas, candidatos). O andamento vem dos candidatos e é passado
+    # ao beat_track como `bpm`: sem ele o librosa monta o tempograma completo da faixa
+    # (384 lags x frames em float64), centenas de MB numa música de poucos minutos.
+    # O programa dinâmico que resta é linear no número de frames.
+    import librosa
+
+    candidatos = candidatos_tempo(onset_env, sr, hop_length)
+    if not candidatos:
+        # Mesmo retorno do beat_track para um envelope sem onsets
+        return 0.0, np.array([], dtype=int), []
+    tempo = candidatos[0]["bpm"]
+    _, beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length, bpm=tempo)
+    return tempo, beats, candidatos
@@ -0,0 +1,178 @@
+import argparse
+import socket
+import sys
+import time
+
+import numpy as np
+
+from andamento import BPM_MAX, BPM_MIN, pico_parabolico, prior_tempo
+
+SR_AO_VIVO = 22050
+HOP_AO_VIVO = 512        # ~23 ms a 22.05 kHz: um valor de onset por hop
+FRAME_AO_VIVO = 1024     # janela curta (46 ms): o frame fecha logo depois do ataque
+N_MELS = 40
+JANELA_TEMPO = 8.0       # segundos de envelope no buffer circular
+MINIMO_TEMPO = 3.0       # antes disso ainda não há batidas suficientes para estimar
+
+# ----------------- RASTREADOR INCREMENTAL -----------------
+
+class RastreadorTempo:
+    # Recebe PCM mono em pedaços de qualquer tamanho e mantém uma estimativa de BPM.
+    # Custo por pedaço limitado: um FFT por hop novo + uma autocorrelação de tamanho fixo
+    # sobre o buffer circular do envelope de onset (não cresce com a duração da escuta).
+    def __init__(self, sr=SR_AO_VIVO, hop_length=HOP_AO_VIVO, frame_length=FRAME_AO_VIVO,
+                 janela=JANELA_TEMPO, minimo=MINIMO_TEMPO, bpm_min=BPM_MIN, bpm_max=BPM_MAX):
+        import librosa
+
+        self.sr = sr
+        self.hop_length = hop_length
+        self.frame_length = frame_length
+        self.minimo = max(1, int(minimo * sr / hop_length))
+        self._janela_fft = np.hanning(frame_length + 1)[:-1].astype(np.float32)
+        self._mel = librosa.filters.mel(sr=sr, n_fft=frame_length, n_mels=N_MELS, fmax=0.5 * sr)
+
+        # Buffer circular do envelope: `_pos` é onde entra o próximo valor
+        self._onsets = np.zeros(max(self.minimo, int(janela * sr / hop_length)), dtype=np.float32)
+        self._pos = 0
+        self.frames = 0
+
+        # Amostras que ainda não fecharam um hop (começa com meia janela de silêncio, center=True)
+        self._pendente = np.zeros(frame_length // 2, dtype=np.float32)
+        self._anterior = None  # último frame mel em dB (continuidade do fluxo espectral)
+
+        # Lags (em frames) candidatos e o prior de andamento, calculados uma vez
+        n = len(self._onsets)
+        self._nfft_acf = 1 << int(np.ceil(np.log2(2 * n)))
+        lag_min = max(1, int(np.floor(60.0 * sr / (hop_length * bpm_max))))
+        lag_max = min(n - 2, int(np.ceil(60.0 * sr / (hop_length * bpm_min))))
+        self._lags = np.arange(lag_min, lag_max + 1)
+        bpms = 60.0 * sr / (hop_length * self._lags)
+        self._prior = prior_tempo(bpms)
+
+        self.bpm = None
+        self.confianca = 0.0
+        self.ultima_latencia = 0.0  # segundos gastos no último pedaço
+
+    @property
+    def segundos(self):
+        # Posição do fluxo (tempo de áudio consumido), não relógio
+        return self.frames * self.hop_length / self.sr
+
+    def _onset(self, frames):
+        # Mesmo envelope do analise_continua (fluxo espectral mel em dB, mediana entre bandas)
+        espectro = np.abs(np.fft.rfft(frames * self._janela_fft, axis=1)) ** 2
+        mel_db = 10.0 * np.log10(np.maximum(1e-10, espectro @ self._mel.T))
+        if self._anterior is None:
+            self._anterior = mel_db[:1]
+        fluxo = np.maximum(0.0, np.diff(np.concatenate([self._anterior, mel_db]), axis=0))
+        self._anterior = mel_db[-1:]
+        return np.median(fluxo, axis=1)
+
+    def _guardar(self, valores):
+        n = len(self._onsets)
+        valores = valores[-n:]
+        indices = (self._pos + np.arange(len(valores))) % n
+        self._onsets[indices] = valores
+        self._pos = (self._pos + len(valores)) % n
+        self.frames += len(valores)
+
+    def _estimar(self):
+        # Autocorrelação do envelope (via FFT) ponderada pelo prior; o pico vira BPM
+        # decimal por interpolação parabólica entre os lags vizinhos
+        validos = min(self.frames, len(self._onsets))
+        env = np.roll(self._onsets, -self._pos)[-validos:]
+        env = env - env.mean()
+        espectro = np.fft.rfft(env, self._nfft_acf)
+        acf = np.fft.irfft(espectro * np.conj(espectro), self._nfft_acf)[:validos]
+        if acf[0] <= 0:
+            return
+        acf /= acf[0]
+        lags = self._lags[self._lags < validos - 1]
+        pontuacao = np.maximum(acf[lags], 0.0) * self._prior[:len(lags)]
+        i = int(np.argmax(pontuacao))
+        lag = lags[0] + pico_parabolico(pontuacao, i)
+        self.bpm = 60.0 * self.sr / (self.hop_length * lag)
+        self.confianca = float(np.clip(acf[lags[i]], 0.0, 1.0))
+
+    def alimentar(self, pcm):
+        # Devolve o BPM atual (None enquanto não há MINIMO_TEMPO de áudio)
+        inicio = time.perf_counter()
+        self._pendente = np.concatenate([self._pendente, np.asarray(pcm, dtype=np.float32)])
+        n_frames = (len(self._pendente) - self.frame_length) // self.hop_length + 1
+        if n_frames > 0:
+            frames = np.lib.stride_tricks.sliding_window_view(
+                self._pendente, self.frame_length)[::self.hop_length][:n_frames]
+            self._guardar(self._onset(frames))
+            self._pendente = self._pendente[n_frames * self.hop_length:]
+            if self.frames >= self.minimo:
+                self._estimar()
+        self.ultima_latencia = time.perf_counter() - inicio
+        return self.bpm
+
+# ----------------- FONTES DE PCM -----------------
+
+def pcm_de_fluxo(fluxo, hop_length=HOP_AO_VIVO):
+    # PCM bruto s16le mono (ex.: `arecord -f S16_LE -c 1 -r 22050`) lido hop a hop
+    tamanho = 2 * hop_length
+    while True:
+        buf = fluxo.read(tamanho)
+        if not buf:
+            return
+        buf = buf[:len(buf) - len(buf) % 2]
+        yield np.frombuffer(buf, dtype="<i2").astype(np.float32) / 32768.0
+
+def pcm_de_socket(porta, host="0.0.0.0", hop_length=HOP_AO_VIVO):
+    # Aceita uma conexão TCP e lê o mesmo formato s16le mono do pipe
+    with socket.create_server((host, porta)) as servidor:
+        conexao, _ = servidor.accept()
+        with conexao, conexao.makefile("rb") as fluxo:
+            yield from pcm_de_fluxo(fluxo, hop_length)
+
+def pcm_de_arquivo(fonte, hop_length=HOP_AO_VIVO):
+    # Teste offline: o arquivo passa pela mesma API, em pedaços de um hop
+    from analise_continua import abrir_pcm
+
+    sr, pedacos = abrir_pcm(fonte, tamanho=hop_length)
+    return sr, pedacos
+
+def acompanhar(pedacos, sr=SR_AO_VIVO, tempo_real=False, **opcoes):
+    # Gera (segundos de áudio, bpm, confiança, latência do pedaço) a cada pedaço.
+    # tempo_real=True dorme o que falta para o relógio acompanhar o áudio (simula a escuta)
+    rastreador = RastreadorTempo(sr=sr, **opcoes)
+    inicio = time.perf_counter()
+    for pedaco in pedacos:
+        bpm = rastreador.alimentar(pedaco)
+        if tempo_real:
+            atraso = rastreador.segundos - (time.perf_counter() - inicio)
+            if atraso > 0:
+                time.sleep(atraso)
+        yield rastreador.segundos, bpm, rastreador.confianca, rastreador.ultima_latencia
+
+# ----------------- CLI -----------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BPM ao vivo a partir de PCM em tempo real.")
+    parser.add_argument("fonte", help='arquivo de áudio, "-" (PCM s16le mono no stdin) ou "tcp:PORTA"')
+    parser.add_argument("--sr", type=int, default=SR_AO_VIVO, help="taxa do PCM bruto (stdin/tcp)")
+    parser.add_argument("--tempo-real", action="store_true", help="arquivo: toca na velocidade real")
+    parser.add_argument("--intervalo", type=float, default=0.5, help="segundos entre linhas impressas")
+    args = parser.parse_args(argv)
+
+    if args.fonte == "-":
+        sr, pedacos = args.sr, pcm_de_fluxo(sys.stdin.buffer)
+    elif args.fonte.startswith("tcp:"):
+        sr, pedacos = args.sr, pcm_de_socket(int(args.fonte[4:]))
+    else:
+        sr, pedacos = pcm_de_arquivo(args.fonte)
+
+    proxima, pior = 0.0, 0.0
+    for segundos, bpm, confianca, latencia in acompanhar(pedacos, sr, args.tempo_real):
+        pior = max(pior, latencia)
+        if segundos >= proxima and bpm is not None:
+            print(f"{segundos:7.2f}s  {bpm:6.1f} BPM  confiança {confianca:.2f}", flush=True)
+            proxima = segundos + args.intervalo
+    print(f"⏱ pior latência por pedaço: {pior * 1000:.1f} ms", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,128 +1,321 @@
-import librosa
-import numpy as np
-import os
-import requests
 import streamlit as st
+import hashlib
+import os
+import time
 import webbrowser
-from repertorio import REPERTORIO
+from collections import OrderedDict
+from analise import PERFIL_PADRAO, PERFIS_ANALISE, ResultadoAnalise, analisar_audio
+from busca import buscar_musicas
+from catalogo import CATALOGO
+from compatibilidade import DISCO_EFEMERO, TOLERANCIA_BPM, BaseAtributos
+from cache_analise import CacheAnalise, chave_analise
+from decodificacao import AudioRecusado
+from download import baixar_trecho_youtube, baixar_youtube_com_cache
+from fila import EXECUTANDO, LIMITE_TEMPO_JOB, NA_FILA, FilaAnalise, FilaCheia, MemoriaInsuficiente
+from grade_batidas import clique_em_memoria, grade_em_texto
+from metricas import coletar_etapas, configurar_logs, publicar_metricas
+from servico import registrar_medidores
+from tonalidade import NOMES_TONALIDADES, formatar_tonalidade
 
 # ----------------- FUNÇÕES -----------------
 
-def baixar_audio_api(video_url):
-    url = "http://127.0.0.1:8000/baixar"
-    r = requests.get(url, params={"video_url": video_url})
-    if r.status_code == 200:
-        with open("musica.mp3", "wb") as f:
-            f.write(r.content)
-        return "musica.mp3"
-    raise Exception(f"Erro no download via API: {r.status_code}")
-
-def estimar_bpm_multiplos(caminho_audio):
-    y, sr = librosa.load(caminho_audio, duration=60)
-    tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-    bpm_principal = float(np.squeeze(tempo))
-    bpm_1_2 = bpm_principal / 2
-    bpm_2 = bpm_principal * 2
-    candidatos = [bpm_principal, bpm_1_2, bpm_2]
-    candidatos_filtrados = []
-    for b in candidatos:
-        val = float(np.squeeze(b))
-        if 40 <= val <= 240:
-            candidatos_filtrados.append(val)
-    candidatos_filtrados = sorted(set([round(b) for b in candidatos_filtrados]))
-    return candidatos_filtrados
-
-def estimar_tom(caminho_audio):
-    y, sr = librosa.load(caminho_audio, duration=60)
-    chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-    chroma_sum = np.sum(chroma, axis=1)
-    nota_idx = chroma_sum.argmax()
-    notas = ['C', 'C#', 'D', 'D#', 'E', 'F',
-             'F#', 'G', 'G#', 'A', 'A#', 'B']
-    tom_estimado = notas[nota_idx]
-    return tom_estimado
-
 def pesquisar_youtube(musica):
-    query = musica.replace(" ", "+").replace("(", "").replace(")", "")
+    # `musica` é um registro do catálogo: título e artistas já vêm separados
+    termos = [musica.titulo, *musica.artistas]
+    if musica.hino:
+        termos.append(f"hino {musica.hino:03d}")
+    query = " ".join(termos).replace(" ", "+")
     return f"https://www.youtube.com/results?search_query={query}"
 
 def pesquisar_cifraclub(musica):
-    query = musica.split("(")[0].strip().replace(" ", "-").lower()
+    query = musica.titulo.replace(" ", "-").lower()
     return f"https://www.cifraclub.com.br/?q={query}"
 
-# ----------------- NOVA FUNÇÃO -----------------
-def tentar_baixar_youtube(video_url):
-    tentativas = []
-
-    # 1 - SaveFrom (exemplo de endpoint, pode mudar)
+@st.cache_resource
+def obter_fila_analise():
+    # Pool de processos compartilhado por todas as sessões; cada processo se aquece
+    # (import do librosa + JIT) ao subir, antes de o primeiro usuário enviar um arquivo
     try:
-        r = requests.get(
-            "https://worker.savefrom.net/api/convert",
-            params={"url": video_url},
-            timeout=10
-        )
-        if r.ok and "url" in r.json():
-            link_mp3 = r.json()["url"]
-            audio = requests.get(link_mp3)
-            if audio.ok:
-                with open("musica.mp3", "wb") as f:
-                    f.write(audio.content)
-                return "musica.mp3"
-    except Exception as e:
-        tentativas.append(f"SaveFrom falhou: {e}")
-
-    # 2 - Y2Mate (exemplo, normalmente precisa POST)
-    try:
-        r = requests.post(
-            "https://www.y2mate.com/mates/en68/analyze/ajax",
-            data={"url": video_url},
-            timeout=10
-        )
-        if r.ok and "url" in r.json():
-            link_mp3 = r.json()["url"]
-            audio = requests.get(link_mp3)
-            if audio.ok:
-                with open("musica.mp3", "wb") as f:
-                    f.write(audio.content)
-                return "musica.mp3"
-    except Exception as e:
-        tentativas.append(f"Y2Mate falhou: {e}")
-
-    # Se todas falharem
-    raise Exception("Não consegui baixar automaticamente.\n\n" + "\n".join(tentativas))
+        return FilaAnalise()
+    except MemoriaInsuficiente as e:
+        # Guardada como resultado: senão cada rerun subiria (e derrubaria) os processos de novo
+        return e
+
+@st.cache_resource
+def obter_cache_analise():
+    return CacheAnalise()
+
+@st.cache_resource
+def iniciar_observabilidade():
+    # Uma vez por processo, antes da fila (o orçamento de memória medido já sai no log):
+    # eventos JSON no stderr e os medidores da fila/cache publicados como no serviço
+    configurar_logs()
+    fila = obter_fila_analise()
+    registrar_medidores(None if isinstance(fila, MemoriaInsuficiente) else fila, obter_cache_analise())
+    return publicar_metricas()
+
+@st.cache_resource
+def obter_base_atributos():
+    return BaseAtributos()
+
+def memoria_sessao(nome):
+    # Dicionário LRU guardado na sessão; entradas mais velhas que o TTL saem a cada acesso
+    memoria = st.session_state.setdefault(nome, OrderedDict())
+    limite = time.time() - TTL_ANALISE_SESSAO
+    for chave in [c for c, e in memoria.items() if e["criado"] < limite]:
+        del memoria[chave]
+    return memoria
+
+def guardar_na_sessao(memoria, chave, valor):
+    memoria[chave] = {**valor, "criado": time.time()}
+    memoria.move_to_end(chave)
+    while len(memoria) > MAX_ANALISES_SESSAO:
+        memoria.popitem(last=False)
+
+def identidade_upload(arquivo):
+    # Nome + tamanho + hash do conteúdo. O hash é calculado uma vez por upload (file_id);
+    # os reruns seguintes não releem os bytes
+    hashes = memoria_sessao("hashes_upload")
+    if arquivo.file_id not in hashes:
+        guardar_na_sessao(hashes, arquivo.file_id,
+                          {"hash": hashlib.sha256(arquivo.getbuffer()).hexdigest()})
+    else:
+        hashes.move_to_end(arquivo.file_id)
+    return arquivo.name, arquivo.size, hashes[arquivo.file_id]["hash"]
+
+def chave_upload(dados, perfil=PERFIL_PADRAO, faixa_inteira=False):
+    if faixa_inteira:
+        return chave_analise(dados, modo="continuo")
+    return chave_analise(dados, **PERFIS_ANALISE[perfil].parametros())
+
+def mostrar_resultado(resultado):
+    st.success("✅ Análise concluída!")
+    st.write(f"**BPMs estimados:** {resultado.bpm_lista}")
+    if resultado.candidatos_tempo:
+        st.caption("Candidatos por confiança: " + ", ".join(
+            f"{c['bpm']:.1f}" + (f" {c['relacao']}" if c["relacao"] not in (None, "principal") else "")
+            + f" ({c['confianca']:.0%})"
+            for c in resultado.candidatos_tempo if c["confianca"] > 0))
+    if resultado.tonalidades:
+        st.write(f"**Tom estimado:** {formatar_tonalidade(resultado.tonalidades)}")
+        st.caption("Outras possibilidades: " + ", ".join(
+            f"{nome} ({score:.2f})" for nome, score in resultado.tonalidades[1:]))
+    else:
+        st.write(f"**Tom estimado:** {resultado.tom}")
+    if resultado.linha_tom and len(resultado.linha_tom) > 1:
+        st.write("**🔀 Mudanças de tom:**")
+        st.table(resultado.linha_tom)
+    if resultado.linha_tempo:
+        st.write("**Linha do tempo:**")
+        st.table(resultado.linha_tempo)
+    batidas = resultado.tempos_batidas()
+    if batidas:
+        st.write(f"**🥁 Grade de batidas:** {len(batidas)} batidas em {resultado.duracao:.0f} s")
+        col_json, col_csv, col_wav = st.columns(3)
+        col_json.download_button("⬇️ JSON", grade_em_texto(batidas, "json", resultado.tempo),
+                                 "batidas.json", "application/json")
+        col_csv.download_button("⬇️ CSV", grade_em_texto(batidas, "csv"), "batidas.csv", "text/csv")
+        # O WAV só é gerado quando pedido, e fica guardado na sessão só para o último resultado:
+        # um rerun qualquer (outro widget) não renderiza nem reenvia dezenas de MB
+        identidade = (resultado.duracao, hash(tuple(batidas)))
+        trilha = st.session_state.get("trilha_cliques")
+        if (trilha is None or trilha["identidade"] != identidade) and col_wav.button("🎧 Gerar trilha de cliques"):
+            wav = clique_em_memoria(batidas, resultado.duracao, sr=SR_CLIQUE_DOWNLOAD)
+            trilha = st.session_state["trilha_cliques"] = {"identidade": identidade, "wav": wav}
+        if trilha is not None and trilha["identidade"] == identidade:
+            col_wav.download_button("⬇️ Trilha de cliques (WAV)", trilha["wav"], "cliques.wav", "audio/wav")
+
+def mostrar_etapas(etapas):
+    # Painel de depuração: onde foi o tempo (e a memória) desta análise
+    with st.expander("🐞 Detalhamento por etapa", expanded=True):
+        if not etapas:
+            st.caption("Resultado do cache: nenhuma etapa foi executada agora.")
+            return
+        st.table([
+            {
+                "Etapa": e["etapa"],
+                "Segundos": e["segundos"],
+                "RSS (MB)": e["rss_mb"],
+                "Δ RSS (MB)": e["delta_rss_mb"],
+            }
+            for e in etapas
+        ])
+
+def associar_ao_repertorio(resumo, nome_arquivo):
+    # Guarda BPM/tom da análise na música do repertório (alimenta "Músicas que combinam")
+    sugestoes = buscar_musicas(nome_arquivo.rsplit(".", 1)[0], limite=1)
+    opcoes = [""] + CATALOGO.titulos()
+    escolha = st.selectbox("🔗 Esta música é do repertório?", opcoes,
+                           index=opcoes.index(sugestoes[0]) if sugestoes else 0)
+    if escolha and st.button("💾 Salvar BPM e tom no repertório"):
+        obter_base_atributos().registrar_resumo(CATALOGO.por_original(escolha).id, resumo)
+        st.success(f"✅ Salvo em: **{escolha}**")
+        aviso_disco_efemero()
+
+def aviso_disco_efemero():
+    # Heroku: o que o app grava some quando o dyno reinicia; só o arquivo versionado fica
+    if not DISCO_EFEMERO:
+        return
+    st.caption("⚠️ Neste servidor os BPMs e tons salvos ficam num disco temporário e se perdem "
+               "quando o app reinicia. Baixe o arquivo e versione-o como `atributos_repertorio.json` "
+               "na raiz do projeto para mantê-los.")
+    st.download_button("⬇️ Baixar atributos do repertório", obter_base_atributos().exportar(),
+                       file_name="atributos_repertorio.json", mime="application/json")
+
+def mostrar_compativeis(musica):
+    base = obter_base_atributos()
+    musica = base.atributos(musica)
+    st.write("**🎚️ Músicas que combinam (andamento e tom)**")
+    col_bpm, col_tom, col_tol = st.columns(3)
+    bpm = col_bpm.number_input("BPM", 30.0, 300.0, float(musica.bpm or 120.0), step=1.0)
+    opcoes_tom = ["(qualquer)"] + NOMES_TONALIDADES
+    tom = col_tom.selectbox("Tom", opcoes_tom,
+                            index=opcoes_tom.index(musica.tom) if musica.tom else 0)
+    tolerancia = col_tol.slider("± BPM", 1, 20, int(TOLERANCIA_BPM))
+    if musica.bpm is None:
+        st.caption("Esta música ainda não foi analisada: informe BPM e tom acima. "
+                   f"{len(base)} música(s) do repertório já têm análise.")
+    aviso_disco_efemero()
+
+    compativeis = base.compativeis(bpm, None if tom == "(qualquer)" else tom, tolerancia,
+                                   excluir=musica)
+    if not compativeis:
+        st.info("Nenhuma música analisada nessa faixa.")
+        return
+    st.table([
+        {
+            "Música": item["musica"].original,
+            "BPM": item["musica"].bpm,
+            "Tom": item["musica"].tom,
+            "Δ BPM": item["diferenca_bpm"],
+            "Compatibilidade": item["compatibilidade"],
+        }
+        for item in compativeis
+    ])
 
 # ----------------- INTERFACE STREAMLIT -----------------
+ROTULOS_PERFIS = {
+    "rapido": "⚡ Rápido (30 s)",
+    "padrao": "🎧 Padrão (60 s)",
+    "preciso": "🎯 Preciso (3 min)",
+}
+
+INTERVALO_CONSULTA = 0.5  # segundos entre consultas ao job em andamento
+PRAZO_JOB = LIMITE_TEMPO_JOB + 30  # segundos executando até a sessão desistir do job
+SR_CLIQUE_DOWNLOAD = 22050  # cliques de 1-1.5 kHz não precisam de 44.1 kHz: metade do WAV
+# Resultados guardados por sessão: um rerun (mexer num widget) redesenha sem reanalisar
+MAX_ANALISES_SESSAO = int(os.environ.get("ANALISE_MAX_SESSAO", 8))
+TTL_ANALISE_SESSAO = float(os.environ.get("ANALISE_TTL_SESSAO", 30 * 60))
+
 st.set_page_config(page_title="🎶 Analisador de Música", page_icon="🎵")
+iniciar_observabilidade()
+fila = obter_fila_analise()
 st.title("🎶 Análise de músicas - alisson9386")
+depurar = st.sidebar.checkbox("🐞 Painel de depuração")
 
 opcao = st.radio(
     "Selecione uma opção:",
     [
         "⬆️ Analisar BPM e TOM de música via upload de arquivo", 
-        #🔗 YouTube (via API)", 
-        #"📂 Repertório pré-definido Oitava Music"
+        #🔗 YouTube (via API)",
+        "📂 Repertório pré-definido Oitava Music",
         ]
 )
 
 # ---- Upload direto ----
-if opcao == "⬆️ Analisar BPM e TOM de música via upload de arquivo":
+if opcao == "⬆️ Analisar BPM e TOM de música via upload de arquivo" and isinstance(fila, MemoriaInsuficiente):
+    st.error(f"🚫 {fila}")
+elif opcao == "⬆️ Analisar BPM e TOM de música via upload de arquivo":
     arquivo = st.file_uploader("Envie a música (MP3 ou M4A)", type=["mp3", "m4a"])
+    perfil = st.radio(
+        "Modo de análise:",
+        list(PERFIS_ANALISE),
+        index=list(PERFIS_ANALISE).index(PERFIL_PADRAO),
+        format_func=lambda p: ROTULOS_PERFIS[p],
+        horizontal=True,
+    )
+    faixa_inteira = st.checkbox("🕒 Analisar a música inteira (linha do tempo por trecho)")
     if arquivo:
-        caminho = f"temp_{arquivo.name}"
-        with open(caminho, "wb") as f:
-            f.write(arquivo.getbuffer())
-        with st.spinner("🎧 Analisando música..."):
-            try:
-                bpm_lista = estimar_bpm_multiplos(caminho)
-                tom = estimar_tom(caminho)
-                st.success("✅ Análise concluída!")
-                st.write(f"**BPMs estimados:** {bpm_lista}")
-                st.write(f"**Tom estimado:** {tom}")
-            except Exception as e:
-                st.error(f"❌ Erro: {e}")
-            finally:
-                if os.path.exists(caminho):
-                    os.remove(caminho)
+        # A análise roda no pool de processos; o script só consulta o job e redesenha
+        analises = memoria_sessao("analises_upload")
+        memo = identidade_upload(arquivo) + (perfil, faixa_inteira)
+        anterior = analises.get(memo)
+        job = st.session_state.get("job_analise")
+        resumo = etapas = erro = None
+
+        if anterior is not None:
+            # Já analisado nesta sessão (com sucesso ou não): nada de hash, cache em disco ou fila
+            analises.move_to_end(memo)
+            chave, resumo, etapas = anterior["chave"], anterior["resumo"], anterior["etapas"]
+            erro = anterior.get("erro")
+            if job is not None and job["chave"] != chave:
+                fila.cancelar(job["id"])
+                del st.session_state["job_analise"]
+        else:
+            cache = obter_cache_analise()
+            dados = arquivo.getbuffer()
+            chave = chave_upload(dados, perfil, faixa_inteira)
+
+            if job is None or job["chave"] != chave:
+                if job is not None:
+                    fila.cancelar(job["id"])
+                    del st.session_state["job_analise"]
+                resumo = cache.obter(chave)
+                if resumo is None:
+                    try:
+                        job_id = fila.submeter_analise(dados, arquivo.name, perfil, faixa_inteira)
+                        st.session_state["job_analise"] = {"id": job_id, "chave": chave}
+                        st.experimental_rerun()
+                    except FilaCheia as e:
+                        st.warning(f"⏳ {e}")
+                    except AudioRecusado as e:
+                        erro = f"🚫 {e}"
+            else:
+                status = fila.status(job["id"])
+                if status is None:
+                    # Job perdido (ex.: servidor reiniciado): submete de novo
+                    del st.session_state["job_analise"]
+                    st.experimental_rerun()
+                elif status == EXECUTANDO and time.time() - job.setdefault("inicio", time.time()) > PRAZO_JOB:
+                    # O próprio processo encerra o job em LIMITE_TEMPO_JOB; passou disso, desiste
+                    fila.cancelar(job["id"])
+                    del st.session_state["job_analise"]
+                    erro = f"❌ A análise não terminou em {PRAZO_JOB} s."
+                elif status in (NA_FILA, EXECUTANDO):
+                    if status == NA_FILA:
+                        st.info(f"⏳ Na fila... ({fila.posicao(job['id'])} análise(s) antes da sua)")
+                    else:
+                        st.info("🎧 Analisando música...")
+                    time.sleep(INTERVALO_CONSULTA)
+                    st.experimental_rerun()
+                else:
+                    del st.session_state["job_analise"]
+                    try:
+                        saida = fila.resultado(job["id"])
+                        resumo, etapas = saida["resumo"], saida["etapas"]
+                        cache.gravar(chave, resumo)
+                    except AudioRecusado as e:
+                        # Recusado já no processo de análise (ex.: nenhum decodificador entende o arquivo)
+                        erro = f"🚫 {e}"
+                    except Exception as e:
+                        erro = f"❌ Erro: {e}"
+
+            # A falha também fica guardada: o mesmo arquivo não volta para a fila a cada rerun
+            if resumo is not None or erro is not None:
+                guardar_na_sessao(analises, memo, {"chave": chave, "resumo": resumo, "etapas": etapas,
+                                                   "erro": erro})
+
+        if erro is not None:
+            st.error(erro)
+            if st.button("🔁 Tentar de novo"):
+                del analises[memo]
+                st.experimental_rerun()
+
+        if resumo is not None:
+            mostrar_resultado(ResultadoAnalise.de_resumo(resumo))
+            associar_ao_repertorio(resumo, arquivo.name)
+            if depurar:
+                mostrar_etapas(etapas)
 
 # ---- YouTube via API ----
 elif opcao == "🔗 YouTube (via API)":
@@ -131,36 +324,27 @@ elif opcao == "🔗 YouTube (via API)":
         if not link.strip():
             st.warning("⚠ Informe um link válido primeiro.")
         else:
-            with st.spinner("⬇ Tentando baixar e analisar..."):
+            with st.spinner("⬇ Tentando baixar e analisar..."), coletar_etapas() as etapas:
                 try:
-                    arquivo_mp3 = tentar_baixar_youtube(link)
-                    bpm_lista = estimar_bpm_multiplos(arquivo_mp3)
-                    tom = estimar_tom(arquivo_mp3)
-                    st.success("✅ Análise concluída!")
-                    st.write(f"**BPMs estimados:** {bpm_lista}")
-                    st.write(f"**Tom estimado:** {tom}")
+                    try:
+                        # Só o trecho analisado, do menor formato só-áudio, direto para a memória
+                        fonte = baixar_trecho_youtube(link, janela=PERFIS_ANALISE[PERFIL_PADRAO].duracao)
+                    except Exception:
+                        fonte = baixar_youtube_com_cache(link)
+                    mostrar_resultado(analisar_audio(fonte))
+                    if depurar:
+                        mostrar_etapas(etapas)
                 except Exception as e:
                     st.error("❌ Não consegui baixar do YouTube automaticamente.")
                     st.info("⬆️ Por favor, faça upload da música no campo de upload de arquivos.")
-                finally:
-                    if os.path.exists("musica.mp3"):
-                        os.remove("musica.mp3")
 
 
 # ---- Repertório ----
 elif opcao == "📂 Repertório pré-definido Oitava Music":
     termo_busca = st.text_input("🔍 Digite o nome da música ou artista:")
 
-    def filtrar_musicas(termo: str):
-        termo = termo.lower().strip()
-        if not termo:
-            return REPERTORIO
-        
-        palavras = termo.split()
-        return [m for m in REPERTORIO if all(p in m.lower() for p in palavras)]
-
-
-    musicas_filtradas = filtrar_musicas(termo_busca)
+    # Índice invertido montado uma vez no import de busca.py (sem acento, tolera erro de digitação)
+    musicas_filtradas = buscar_musicas(termo_busca)
 
     if not musicas_filtradas:
         st.warning("Nenhuma música encontrada.")
@@ -173,8 +357,9 @@ elif opcao == "📂 Repertório pré-definido Oitava Music":
         col1, col2 = st.columns(2)
 
         if(escolha):
+            musica = CATALOGO.por_original(escolha)
             with col1:
-                url_youtube = pesquisar_youtube(escolha)
+                url_youtube = pesquisar_youtube(musica)
                 st.markdown(f'''
                     <a href="{url_youtube}" target="_blank">
                         <div style="background:#FF0000;color:#fff;padding:8px 12px;border-radius:6px;text-align:center;font-weight:bold;">
@@ -184,7 +369,7 @@ elif opcao == "📂 Repertório pré-definido Oitava Music":
                 ''', unsafe_allow_html=True)
 
             with col2:
-                url_cifra = pesquisar_cifraclub(escolha)
+                url_cifra = pesquisar_cifraclub(musica)
                 st.markdown(f'''
                     <a href="{url_cifra}" target="_blank">
                         <div style="background:#4CAF50;color:#fff;padding:8px 12px;border-radius:6px;text-align:center;font-weight:bold;">
@@ -193,6 +378,8 @@ elif opcao == "📂 Repertório pré-definido Oitava Music":
                     </a>
                 ''', unsafe_allow_html=True)
 
+            mostrar_compativeis(musica)
+
 # ----------------- Rodapé -----------------
 st.markdown("""
     <div style="text-align:center; margin-top:30px; font-size:12px; color:gray;">
@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+import time
+
+# Importar analise primeiro define NUMBA_CACHE_DIR antes de o librosa puxar o numba
+from analise import PERFIS_ANALISE, analisar_audio
+
+SR_FIXTURE = 44100
+DURACAO_FIXTURE = 8
+
+# ----------------- AQUECIMENTO -----------------
+
+def gerar_fixture(caminho):
+    import numpy as np
+    import soundfile as sf
+
+    # Clique a 120 BPM sobre um acorde de A maior: exercita onset, beat_track e chroma
+    t = np.arange(SR_FIXTURE * DURACAO_FIXTURE) / SR_FIXTURE
+    y = 0.1 * sum(np.sin(2 * np.pi * f * t) for f in (220.0, 277.18, 329.63))
+    for inicio in np.arange(0, DURACAO_FIXTURE, 0.5):
+        i = int(inicio * SR_FIXTURE)
+        y[i:i + 400] += np.exp(-np.arange(400) / 80.0)
+    # Estéreo a 44.1 kHz para passar também pela mixagem mono e pelo resampler de cada perfil
+    sf.write(caminho, np.stack([y, y], axis=1).astype(np.float32), SR_FIXTURE)
+
+def aquecer(saida=sys.stdout):
+    relatorio = {}
+
+    inicio = time.perf_counter()
+    import librosa  # noqa: F401
+    relatorio["import_librosa"] = time.perf_counter() - inicio
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "aquecimento.wav")
+        gerar_fixture(caminho)
+
+        for nome in PERFIS_ANALISE:
+            inicio = time.perf_counter()
+            analisar_audio(caminho, nome)
+            relatorio[f"primeira_analise_{nome}"] = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            analisar_audio(caminho, nome)
+            relatorio[f"segunda_analise_{nome}"] = time.perf_counter() - inicio
+
+    print(f"🔥 Cache do numba: {os.environ['NUMBA_CACHE_DIR']}", file=saida)
+    for etapa, segundos in relatorio.items():
+        print(f"⏱  {etapa}: {segundos:.2f} s", file=saida)
+    return relatorio
+
+if __name__ == "__main__":
+    aquecer()
@@ -0,0 +1,444 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+
+import numpy as np
+
+from analise import PERFIS_ANALISE, analisar_audio, candidatos_bpm
+from decodificacao import pasta_temporaria
+from tonalidade import NOMES_TONALIDADES, NOTAS
+
+SR_FIXTURE = 44100
+DURACAO_FIXTURE = 40           # segundos: cobre a janela dos perfis rapido (30 s) e padrao/preciso
+TOLERANCIA_TEMPO = 0.04        # 4% (critério usual do MIREX)
+SEMENTE = 2024
+
+# ----------------- FIXTURES SINTÉTICAS -----------------
+
+def _clique(n=600, semente=SEMENTE):
+    # Ruído com decaimento exponencial: ataque largo como um chimbal/caixa
+    gerador = np.random.default_rng(semente)
+    return gerador.standard_normal(n) * np.exp(-np.arange(n) / 90.0)
+
+def _tempos_batidas(bpm_inicial, bpm_final, duracao):
+    # Rampa linear de andamento: batida k quando a fase acumulada (em batidas) passa por k
+    t = np.arange(0, duracao, 0.001)
+    bpm = bpm_inicial + (bpm_final - bpm_inicial) * t / duracao
+    fase = np.cumsum(bpm / 60.0) * 0.001
+    return np.interp(np.arange(int(fase[-1])), fase, t)
+
+def sintetizar_clique(bpm_inicial, bpm_final=None, swing=False, duracao=DURACAO_FIXTURE, sr=SR_FIXTURE):
+    bpm_final = bpm_inicial if bpm_final is None else bpm_final
+    y = np.zeros(int(duracao * sr))
+    batidas = _tempos_batidas(bpm_inicial, bpm_final, duracao)
+    clique = _clique()
+
+    def somar(inicio, ganho):
+        i = int(inicio * sr)
+        trecho = clique[:len(y) - i]
+        y[i:i + len(trecho)] += ganho * trecho
+
+    for k, inicio in enumerate(batidas):
+        somar(inicio, 1.0 if k % 4 == 0 else 0.7)  # tempo forte do compasso acentuado
+        if swing and k + 1 < len(batidas):
+            # Colcheia "swingada": a segunda colcheia cai a 2/3 da batida
+            somar(inicio + (batidas[k + 1] - inicio) * 2 / 3, 0.35)
+    return y / np.max(np.abs(y))
+
+def _nota(frequencia, duracao, sr):
+    # Tom harmônico (4 parciais, 1/k) com envelope de ataque e decaimento
+    t = np.arange(int(duracao * sr)) / sr
+    onda = sum(np.sin(2 * np.pi * frequencia * k * t) / k for k in range(1, 5))
+    return onda * np.minimum(1.0, t / 0.01) * np.exp(-t / (duracao * 0.8))
+
+def _frequencia(semitom_de_a4):
+    return 440.0 * 2 ** (semitom_de_a4 / 12)
+
+def sintetizar_progressao(tonica, menor, duracao=DURACAO_FIXTURE, sr=SR_FIXTURE, acorde_s=2.0):
+    # I-IV-V-I (maior) ou i-iv-V-i (menor harmônica), com o baixo na fundamental
+    terca = 3 if menor else 4
+    graus = [(0, terca), (5, terca), (7, 4), (0, terca)]
+    y = np.zeros(int(duracao * sr))
+    base = tonica - 9  # semitons relativos ao A4; tônica 0 = C4
+    for k, inicio in enumerate(np.arange(0, duracao, acorde_s)):
+        grau, terca_grau = graus[k % len(graus)]
+        raiz = base + grau
+        nota = sum(_nota(_frequencia(raiz + intervalo), acorde_s, sr) for intervalo in (0, terca_grau, 7))
+        nota += 0.8 * _nota(_frequencia(raiz - 24), acorde_s, sr)
+        i = int(inicio * sr)
+        y[i:i + len(nota)] += nota[:len(y) - i]
+    return y / np.max(np.abs(y))
+
+def fixtures_padrao(duracao=DURACAO_FIXTURE):
+    # (nome, tipo, verdade, gerador) — a verdade do tempo é (bpm_inicial, bpm_final)
+    casos = []
+    for bpm in (70, 90, 100, 120, 128, 140, 160, 174):
+        casos.append((f"clique_{bpm}", "tempo", (bpm, bpm), lambda b=bpm: sintetizar_clique(b, duracao=duracao)))
+    for bpm in (96, 120):
+        casos.append((f"swing_{bpm}", "tempo", (bpm, bpm),
+                      lambda b=bpm: sintetizar_clique(b, swing=True, duracao=duracao)))
+    for inicial, final in ((100, 120), (130, 115)):
+        casos.append((f"rampa_{inicial}_{final}", "tempo", (inicial, final),
+                      lambda a=inicial, b=final: sintetizar_clique(a, b, duracao=duracao)))
+    for tonica in (0, 2, 4, 5, 7, 10):           # C, D, E, F, G, A# maior
+        nome = NOMES_TONALIDADES[tonica]
+        casos.append((f"progressao_{nome.replace(' ', '_')}", "tom", nome,
+                      lambda t=tonica: sintetizar_progressao(t, False, duracao)))
+    for tonica in (9, 4, 2, 0, 7, 1):            # A, E, D, C, G, C# menor
+        nome = NOMES_TONALIDADES[12 + tonica]
+        casos.append((f"progressao_{nome.replace(' ', '_')}", "tom", nome,
+                      lambda t=tonica: sintetizar_progressao(t, True, duracao)))
+    return casos
+
+def gravar_fixtures(pasta, duracao=DURACAO_FIXTURE):
+    import soundfile as sf
+
+    fixtures = []
+    for nome, tipo, verdade, gerar in fixtures_padrao(duracao):
+        caminho = os.path.join(pasta, f"{nome}.wav")
+        y = gerar().astype(np.float32) * 0.8
+        # Estéreo a 44.1 kHz, como um arquivo real: passa pela mixagem mono e pelo resampler
+        sf.write(caminho, np.stack([y, y], axis=1), SR_FIXTURE)
+        fixtures.append({"nome": nome, "tipo": tipo, "verdade": verdade, "caminho": caminho,
+                         "duracao": duracao})
+    return fixtures
+
+# ----------------- ACURÁCIA -----------------
+
+def verdade_tempo(verdade, janela, duracao):
+    # Andamento médio dentro da janela analisada (rampas mudam de BPM ao longo da faixa)
+    inicial, final = verdade
+    fim = min(janela or duracao, duracao)
+    return inicial + (final - inicial) * fim / (2 * duracao)
+
+def classificar_tempo(estimado, verdadeiro, tolerancia=TOLERANCIA_TEMPO):
+    # exata · oitava (x2, x1/2) · quinta (x3/2, x2/3: a razão de uma quinta justa) · errada.
+    # Sem estimativa (None) conta como errada
+    if estimado is None:
+        return "errada"
+    razao = estimado / verdadeiro
+    for classe, fatores in (("exata", (1.0,)), ("oitava", (2.0, 0.5)), ("quinta", (1.5, 2 / 3))):
+        if any(abs(razao / f - 1) <= tolerancia for f in fatores):
+            return classe
+    return "errada"
+
+def classificar_tom(estimado, verdadeiro):
+    # exata · quinta (dominante/subdominante, mesmo modo) · relativa · homonima · errada.
+    # Estimadores que só devolvem a nota (sem modo) são comparados pela tônica.
+    indice = NOMES_TONALIDADES.index(verdadeiro)
+    tonica, menor = indice % 12, indice >= 12
+    if estimado in NOTAS:
+        nota = NOTAS.index(estimado)
+        relativa = (tonica + 3) % 12 if menor else (tonica + 9) % 12
+        if nota == tonica:
+            return "exata"
+        if nota in ((tonica + 7) % 12, (tonica + 5) % 12):
+            return "quinta"
+        return "relativa" if nota == relativa else "errada"
+
+    estimado_idx = NOMES_TONALIDADES.index(estimado)
+    nota, menor_est = estimado_idx % 12, estimado_idx >= 12
+    if estimado_idx == indice:
+        return "exata"
+    if menor_est == menor and nota in ((tonica + 7) % 12, (tonica + 5) % 12):
+        return "quinta"
+    if menor_est != menor and nota == ((tonica + 3) % 12 if menor else (tonica + 9) % 12):
+        return "relativa"
+    if nota == tonica:
+        return "homonima"
+    return "errada"
+
+# ----------------- ESTIMADORES -----------------
+
+def _tempo(caminho, perfil):
+    # Com perfil "padrao" é exatamente estimar_bpm_multiplos
+    resultado = analisar_audio(caminho, perfil, calcular_tom=False)
+    return {"tempo": resultado.tempo, "bpm_lista": resultado.bpm_lista}
+
+def _tom(caminho, perfil):
+    # Com perfil "padrao" é estimar_tom (mais a estimativa maior/menor de Krumhansl)
+    resultado = analisar_audio(caminho, perfil, calcular_tempo=False)
+    return {"tom": resultado.tonalidades[0][0] if resultado.tonalidades else resultado.tom}
+
+def _completo(caminho, perfil, paralelo=False):
+    # Tempo e tom na mesma chamada (um único decode), em sequência ou em paralelo
+    resultado = analisar_audio(caminho, perfil, paralelo=paralelo)
+    return {"tempo": resultado.tempo, "bpm_lista": resultado.bpm_lista,
+            "tom": resultado.tonalidades[0][0]}
+
+def _paralelo(caminho, perfil):
+    return _completo(caminho, perfil, paralelo=True)
+
+def _continuo(caminho, perfil):
+    from analise_continua import analisar_audio_continuo
+
+    resultado = analisar_audio_continuo(caminho)
+    return {"tempo": resultado.tempo, "bpm_lista": resultado.bpm_lista, "tom": resultado.tonalidades[0][0]}
+
+def _ao_vivo(caminho, perfil):
+    from ao_vivo import acompanhar, pcm_de_arquivo
+
+    # Última estimativa do rastreador incremental, com o arquivo entregue hop a hop
+    sr, pedacos = pcm_de_arquivo(caminho)
+    bpm = None
+    for _, bpm, _, _ in acompanhar(pedacos, sr):
+        pass
+    # Fixture mais curta que MINIMO_TEMPO: o rastreador não chega a estimar
+    return {"tempo": bpm, "bpm_lista": candidatos_bpm(bpm) if bpm is not None else []}
+
+# nome -> (função, tipos de fixture avaliados, usa perfil?)
+ESTIMADORES = {
+    "tempo": (_tempo, ("tempo",), True),
+    "tom": (_tom, ("tom",), True),
+    "completo": (_completo, ("tempo", "tom"), True),
+    "paralelo": (_paralelo, ("tempo", "tom"), True),
+    "continuo": (_continuo, ("tempo", "tom"), False),
+    "ao_vivo": (_ao_vivo, ("tempo",), False),
+}
+
+def _rss_mb():
+    # ru_maxrss: pico do processo (KiB no Linux, bytes no macOS)
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def _avaliar(fixture, saida, perfil):
+    janela = PERFIS_ANALISE[perfil].duracao if perfil else None
+    registro = {"fixture": fixture["nome"], "tipo": fixture["tipo"]}
+    if fixture["tipo"] == "tempo":
+        verdadeiro = verdade_tempo(fixture["verdade"], janela, fixture["duracao"])
+        registro.update(verdade=round(verdadeiro, 2), estimado=None if saida["tempo"] is None else round(saida["tempo"], 2),
+                        classe=classificar_tempo(saida["tempo"], verdadeiro),
+                        na_lista=any(abs(b / verdadeiro - 1) <= TOLERANCIA_TEMPO
+                                     for b in saida["bpm_lista"]))
+    else:
+        registro.update(verdade=fixture["verdade"], estimado=saida["tom"],
+                        classe=classificar_tom(saida["tom"], fixture["verdade"]))
+    return registro
+
+def executar_caso(estimador, perfil, fixtures):
+    # Roda num processo próprio: o pico de RSS medido é só deste estimador/perfil
+    funcao, tipos, _ = ESTIMADORES[estimador]
+    fixtures = [f for f in fixtures if f["tipo"] in tipos]
+
+    inicio = time.perf_counter()
+    funcao(fixtures[0]["caminho"], perfil)  # import do librosa + JIT do numba
+    primeira = time.perf_counter() - inicio
+    rss_base = _rss_mb()
+
+    registros = []
+    for fixture in fixtures:
+        inicio = time.perf_counter()
+        saida = funcao(fixture["caminho"], perfil)
+        segundos = time.perf_counter() - inicio
+        registro = _avaliar(fixture, saida, perfil)
+        registro["segundos"] = round(segundos, 4)
+        registros.append(registro)
+
+    segundos = np.array([r["segundos"] for r in registros])
+    resumo = {
+        "estimador": estimador,
+        "perfil": perfil or "-",
+        "primeira_chamada_s": round(primeira, 3),
+        "tempo_s": {
+            "media": round(float(segundos.mean()), 4),
+            "mediana": round(float(np.median(segundos)), 4),
+            "max": round(float(segundos.max()), 4),
+            "total": round(float(segundos.sum()), 3),
+        },
+        "rss_base_mb": round(rss_base, 1),
+        "rss_pico_mb": round(_rss_mb(), 1),
+        "acuracia": {},
+        "fixtures": registros,
+    }
+    for tipo in tipos:
+        classes = [r["classe"] for r in registros if r["tipo"] == tipo]
+        resumo["acuracia"][tipo] = {c: round(classes.count(c) / len(classes), 3)
+                                    for c in sorted(set(classes) | {"exata"})}
+        resumo["acuracia"][tipo]["n"] = len(classes)
+    return resumo
+
+# ----------------- RELATÓRIO -----------------
+
+def _versao_git():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _ambiente():
+    import librosa
+
+    return {
+        "commit": _versao_git(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "librosa": librosa.__version__,
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def executar_benchmark(estimadores=None, perfis=None, duracao=DURACAO_FIXTURE, saida=sys.stderr):
+    estimadores = estimadores or list(ESTIMADORES)
+    perfis = perfis or list(PERFIS_ANALISE)
+    casos = []
+    for estimador in estimadores:
+        if ESTIMADORES[estimador][2]:
+            casos.extend((estimador, perfil) for perfil in perfis)
+        else:
+            casos.append((estimador, None))
+
+    with tempfile.TemporaryDirectory(prefix="benchmark_", dir=pasta_temporaria()) as pasta:
+        fixtures = gravar_fixtures(pasta, duracao)
+        resultados = []
+        for estimador, perfil in casos:
+            # Um processo novo por caso, um de cada vez: tempos sem concorrência e RSS isolado
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                resultado = executor.submit(executar_caso, estimador, perfil, fixtures).result()
+            resultados.append(resultado)
+            acertos = ", ".join(f"{tipo} {a['exata']:.0%}" for tipo, a in resultado["acuracia"].items())
+            print(f"⏱  {estimador}/{resultado['perfil']}: {resultado['tempo_s']['media']:.2f} s/faixa, "
+                  f"pico {resultado['rss_pico_mb']:.0f} MB, exata: {acertos}", file=saida)
+
+    return {
+        "ambiente": _ambiente(),
+        "fixtures": {"duracao_s": duracao, "sr": SR_FIXTURE, "semente": SEMENTE,
+                     "tolerancia_tempo": TOLERANCIA_TEMPO},
+        "casos": resultados,
+    }
+
+def comparar(relatorio, referencia, saida=sys.stdout):
+    # Diferença por estimador/perfil entre dois relatórios (ex.: antes/depois de um commit)
+    anteriores = {(c["estimador"], c["perfil"]): c for c in referencia["casos"]}
+    for caso in relatorio["casos"]:
+        chave = (caso["estimador"], caso["perfil"])
+        if chave not in anteriores:
+            continue
+        antes = anteriores[chave]
+        linha = [f"{chave[0]}/{chave[1]}:",
+                 f"tempo {antes['tempo_s']['media']:.3f} -> {caso['tempo_s']['media']:.3f} s",
+                 f"pico {antes['rss_pico_mb']:.0f} -> {caso['rss_pico_mb']:.0f} MB"]
+        for tipo, acuracia in caso["acuracia"].items():
+            anterior = antes["acuracia"].get(tipo, {}).get("exata", 0.0)
+            linha.append(f"{tipo} exata {anterior:.0%} -> {acuracia['exata']:.0%}")
+        print("  ".join(linha), file=saida)
+
+# ----------------- VERIFICAÇÕES -----------------
+
+def verificar_entradas_curtas(pasta, saida=sys.stderr):
+    # Clipes curtos e silêncio: nenhum estimador pode quebrar nem inventar andamento
+    from andamento import candidatos_tempo
+
+    for n in (0, 1, 2):
+        assert candidatos_tempo(np.ones(n), SR_FIXTURE, 512) == [], f"envelope de {n} frame(s)"
+    assert candidatos_tempo(np.zeros(5000), SR_FIXTURE, 512) == [], "envelope nulo"
+
+    import soundfile as sf
+
+    for nome, y in (("mil_amostras", 0.1 * np.random.default_rng(SEMENTE).standard_normal(1000)),
+                    ("silencio", np.zeros(20 * SR_FIXTURE))):
+        caminho = os.path.join(pasta, f"{nome}.wav")
+        sf.write(caminho, y.astype(np.float32), SR_FIXTURE)
+        for perfil in PERFIS_ANALISE:
+            resultado = analisar_audio(caminho, perfil)
+            assert not resultado.candidatos_tempo, f"{nome}/{perfil}: {resultado.candidatos_tempo}"
+        print(f"✅ {nome}: sem erro e sem candidatos inventados", file=saida)
+
+def _pico_alocado_mb(funcao, *args):
+    # Pico das alocações Python/numpy durante a chamada (o ru_maxrss não volta a cair)
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        funcao(*args)
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+def verificar_memoria_continua(pasta, saida=sys.stderr, duracoes=(120, 480), margem_mb=16):
+    # A análise da faixa inteira lê em blocos: 4x mais áudio não pode custar 4x mais memória
+    import soundfile as sf
+    from analise_continua import analisar_audio_continuo
+
+    picos = []
+    for duracao in duracoes:
+        caminho = os.path.join(pasta, f"clique_{duracao}s.wav")
+        sf.write(caminho, sintetizar_clique(120, duracao=duracao).astype(np.float32), SR_FIXTURE)
+        analisar_audio_continuo(caminho)  # import do librosa + JIT fora da medida
+        picos.append(_pico_alocado_mb(analisar_audio_continuo, caminho))
+        print(f"⏱  continuo {duracao} s: pico {picos[-1]:.1f} MB alocados", file=saida)
+    assert picos[-1] - picos[0] <= margem_mb, f"pico cresce com a duração: {picos}"
+
+def verificar_limite_memoria(pasta, saida=sys.stderr, duracao=180):
+    # Cada modo oferecido na interface cabe no mínimo que a fila garante a um job (ela se
+    # recusa a subir com menos), com o mesmo RLIMIT_AS relativo dos processos de análise
+    import soundfile as sf
+    from analise_continua import analisar_audio_continuo
+    from fila import MEMORIA_JOB_MINIMA_MB, limitar_recursos
+
+    caminho = os.path.join(pasta, f"clique_{duracao}s.wav")
+    y = sintetizar_clique(120, duracao=duracao)
+    sf.write(caminho, np.stack([y, y], axis=1).astype(np.float32), SR_FIXTURE)
+    modos = [(perfil, partial(analisar_audio, caminho, perfil)) for perfil in PERFIS_ANALISE]
+    modos.append(("faixa inteira", partial(analisar_audio_continuo, caminho)))
+    for nome, analisar in modos:
+        analisar()  # import do librosa + JIT fora do limite, como no aquecimento
+        inicio = time.perf_counter()
+        with limitar_recursos(cpu=None, memoria_mb=MEMORIA_JOB_MINIMA_MB, tempo=None):
+            analisar()
+        print(f"✅ {nome}: {time.perf_counter() - inicio:.1f} s dentro de {MEMORIA_JOB_MINIMA_MB} MB", file=saida)
+
+VERIFICACOES = {
+    "entradas_curtas": verificar_entradas_curtas,
+    "memoria_continua": verificar_memoria_continua,
+    "limite_memoria": verificar_limite_memoria,
+}
+
+def executar_verificacoes(nomes=None, saida=sys.stderr):
+    with tempfile.TemporaryDirectory(prefix="verificacao_", dir=pasta_temporaria()) as pasta:
+        for nome in nomes or VERIFICACOES:
+            VERIFICACOES[nome](pasta, saida)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de velocidade e acurácia dos estimadores.")
+    parser.add_argument("-o", "--saida", default="benchmark.json",
+                        help="relatório JSON (padrão: benchmark.json; '-' para stdout)")
+    parser.add_argument("-e", "--estimador", action="append", choices=list(ESTIMADORES),
+                        help="estimador a medir (repetível; padrão: todos)")
+    parser.add_argument("-p", "--perfil", action="append", choices=list(PERFIS_ANALISE),
+                        help="perfil de análise (repetível; padrão: todos)")
+    parser.add_argument("--duracao", type=float, default=DURACAO_FIXTURE,
+                        help="duração de cada fixture em segundos")
+    parser.add_argument("--comparar", metavar="RELATORIO",
+                        help="relatório anterior para comparar com o atual")
+    parser.add_argument("--verificar", nargs="*", choices=list(VERIFICACOES), metavar="NOME",
+                        help=f"só roda as verificações (asserções) em vez do benchmark: {', '.join(VERIFICACOES)}")
+    args = parser.parse_args(argv)
+
+    if args.verificar is not None:
+        executar_verificacoes(args.verificar)
+        return 0
+
+    relatorio = executar_benchmark(args.estimador, args.perfil, args.duracao)
+    texto = json.dumps(relatorio, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.saida == "-":
+        print(texto)
+    else:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(relatorio, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
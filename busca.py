@@ -0,0 +1,133 @@
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+from repertorio import REPERTORIO
+
+PESO_EXATO = 3.0
+PESO_PREFIXO = 2.0
+PESO_TRECHO = 1.5
+PESO_APROXIMADO = 1.0
+SIMILARIDADE_MINIMA = 0.45     # Dice entre trigramas para considerar um erro de digitação
+MAX_CANDIDATOS_APROXIMADOS = 20
+
+# ----------------- NORMALIZAÇÃO -----------------
+
+def normalizar(texto):
+    # "Espírito" -> "espirito", "minh'alma" -> "minh alma"
+    sem_acento = "".join(
+        c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c)
+    )
+    return re.sub(r"[^a-z0-9]+", " ", sem_acento.lower()).strip()
+
+def tokenizar(texto):
+    return normalizar(texto).split()
+
+def trigramas(token):
+    # Bordas marcadas para que início/fim do token também contem
+    marcado = f"  {token} "
+    return {marcado[i:i + 3] for i in range(len(marcado) - 2)}
+
+def distancia_edicao(a, b, limite):
+    # Levenshtein com corte: desiste assim que a linha inteira passa do limite
+    if abs(len(a) - len(b)) > limite:
+        return limite + 1
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        atual = [i]
+        for j, cb in enumerate(b, 1):
+            atual.append(min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + (ca != cb)))
+        if min(atual) > limite:
+            return limite + 1
+        anterior = atual
+    return anterior[-1]
+
+# ----------------- ÍNDICE -----------------
+
+class IndiceBusca:
+    def __init__(self, titulos):
+        self.titulos = list(titulos)
+        postings = defaultdict(set)
+        for doc_id, titulo in enumerate(self.titulos):
+            for token in tokenizar(titulo):
+                postings[token].add(doc_id)
+        self.vocabulario = sorted(postings)
+        self.postings = {token: frozenset(docs) for token, docs in postings.items()}
+        # trigrama -> tokens do vocabulário que o contêm (trechos e erros de digitação)
+        self.trigramas = defaultdict(set)
+        for token in self.vocabulario:
+            for tri in trigramas(token):
+                self.trigramas[tri].add(token)
+
+    def _por_prefixo(self, palavra):
+        i = bisect_left(self.vocabulario, palavra)
+        while i < len(self.vocabulario) and self.vocabulario[i].startswith(palavra):
+            yield self.vocabulario[i]
+            i += 1
+
+    def _por_trecho(self, palavra):
+        if len(palavra) < 3:
+            return set()
+        # Tokens que contêm todos os trigramas internos da palavra; confirma com `in`
+        internos = [palavra[i:i + 3] for i in range(len(palavra) - 2)]
+        candidatos = set.intersection(*(self.trigramas.get(t, set()) for t in internos))
+        return {t for t in candidatos if palavra in t}
+
+    def _aproximados(self, palavra):
+        tris = trigramas(palavra)
+        contagem = defaultdict(int)
+        for tri in tris:
+            for token in self.trigramas.get(tri, ()):
+                contagem[token] += 1
+        limite = 1 if len(palavra) <= 5 else 2
+        melhores = sorted(contagem.items(), key=lambda item: -item[1])[:MAX_CANDIDATOS_APROXIMADOS]
+        resultado = {}
+        for token, comuns in melhores:
+            dice = 2 * comuns / (len(tris) + len(trigramas(token)))
+            if dice >= SIMILARIDADE_MINIMA and distancia_edicao(palavra, token, limite) <= limite:
+                resultado[token] = dice
+        return resultado
+
+    def _pontuar_palavra(self, palavra):
+        # doc_id -> melhor peso desta palavra no documento
+        pesos = {}
+
+        def marcar(tokens, peso):
+            for token in tokens:
+                for doc_id in self.postings[token]:
+                    if pesos.get(doc_id, 0) < peso:
+                        pesos[doc_id] = peso
+
+        if palavra in self.postings:
+            marcar([palavra], PESO_EXATO)
+        marcar(self._por_prefixo(palavra), PESO_PREFIXO)
+        marcar(self._por_trecho(palavra), PESO_TRECHO)
+        if not pesos:
+            for token, dice in self._aproximados(palavra).items():
+                marcar([token], PESO_APROXIMADO * dice)
+        return pesos
+
+    def buscar(self, termo, limite=None):
+        palavras = tokenizar(termo)
+        if not palavras:
+            return self.titulos[:limite] if limite else list(self.titulos)
+
+        pontuacoes = [self._pontuar_palavra(p) for p in palavras]
+        # Interseção das listas, começando pela menor
+        pontuacoes.sort(key=len)
+        docs = set(pontuacoes[0])
+        for pesos in pontuacoes[1:]:
+            docs &= pesos.keys()
+            if not docs:
+                return []
+
+        ranking = sorted(docs, key=lambda d: (-sum(p[d] for p in pontuacoes), d))
+        if limite:
+            ranking = ranking[:limite]
+        return [self.titulos[d] for d in ranking]
+
+INDICE_REPERTORIO = IndiceBusca(REPERTORIO)
+
+def buscar_musicas(termo, limite=None):
+    return INDICE_REPERTORIO.buscar(termo, limite)
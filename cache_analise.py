@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from analise import VERSAO_ANALISE
+
+CAMINHO_PADRAO = os.environ.get("CACHE_ANALISE", os.path.join(".cache", "analise.sqlite3"))
+MAX_ENTRADAS_PADRAO = 5000
+MAX_BYTES_PADRAO = 50 * 1024 * 1024
+MAX_IDADE_PADRAO = 90 * 24 * 3600  # 90 dias
+
+# ----------------- CACHE DE RESULTADOS -----------------
+
+def chave_analise(dados, **parametros):
+    # Endereçado por conteúdo: hash dos bytes + parâmetros que influenciam o resultado
+    # + versão da análise (resultados de versões antigas não são servidos)
+    h = hashlib.sha256()
+    h.update(memoryview(dados))
+    h.update(json.dumps({**parametros, "versao": VERSAO_ANALISE}, sort_keys=True).encode())
+    return h.hexdigest()
+
+class CacheAnalise:
+    def __init__(self, caminho=CAMINHO_PADRAO, max_entradas=MAX_ENTRADAS_PADRAO,
+                 max_bytes=MAX_BYTES_PADRAO, max_idade=MAX_IDADE_PADRAO):
+        self.caminho = caminho
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.max_idade = max_idade
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        with self._conectar() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS resultados (
+                    chave TEXT PRIMARY KEY,
+                    valor TEXT NOT NULL,
+                    tamanho INTEGER NOT NULL,
+                    criado REAL NOT NULL,
+                    acessado REAL NOT NULL
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS idx_acessado ON resultados (acessado)")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS contadores (
+                    nome TEXT PRIMARY KEY,
+                    valor INTEGER NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _conectar(self):
+        # Uma conexão por operação: o Streamlit executa cada sessão numa thread diferente
+        con = sqlite3.connect(self.caminho, timeout=10)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def _incrementar(self, con, nome):
+        con.execute(
+            "INSERT INTO contadores (nome, valor) VALUES (?, 1) "
+            "ON CONFLICT(nome) DO UPDATE SET valor = valor + 1",
+            (nome,)
+        )
+
+    def obter(self, chave):
+        agora = time.time()
+        with self._conectar() as con:
+            linha = con.execute(
+                "SELECT valor, criado FROM resultados WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None or agora - linha[1] > self.max_idade:
+                self._incrementar(con, "misses")
+                return None
+            con.execute("UPDATE resultados SET acessado = ? WHERE chave = ?", (agora, chave))
+            self._incrementar(con, "hits")
+        return json.loads(linha[0])
+
+    def gravar(self, chave, valor):
+        agora = time.time()
+        texto = json.dumps(valor)
+        with self._conectar() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO resultados (chave, valor, tamanho, criado, acessado) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (chave, texto, len(texto), agora, agora)
+            )
+            self._despejar(con, agora)
+
+    def _despejar(self, con, agora):
+        con.execute("DELETE FROM resultados WHERE criado < ?", (agora - self.max_idade,))
+        total, tamanho = con.execute(
+            "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM resultados"
+        ).fetchone()
+        if total <= self.max_entradas and tamanho <= self.max_bytes:
+            return
+        # Remove os menos acessados recentemente até voltar aos limites
+        removidos = 0
+        for chave, tam in con.execute(
+            "SELECT chave, tamanho FROM resultados ORDER BY acessado ASC"
+        ).fetchall():
+            if total <= self.max_entradas and tamanho <= self.max_bytes:
+                break
+            con.execute("DELETE FROM resultados WHERE chave = ?", (chave,))
+            total -= 1
+            tamanho -= tam
+            removidos += 1
+        con.execute(
+            "INSERT INTO contadores (nome, valor) VALUES ('despejos', ?) "
+            "ON CONFLICT(nome) DO UPDATE SET valor = valor + excluded.valor",
+            (removidos,)
+        )
+
+    def obter_ou_calcular(self, chave, calcular):
+        valor = self.obter(chave)
+        if valor is None:
+            valor = calcular()
+            self.gravar(chave, valor)
+        return valor
+
+    def estatisticas(self):
+        with self._conectar() as con:
+            contadores = dict(con.execute("SELECT nome, valor FROM contadores").fetchall())
+            total, tamanho = con.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM resultados"
+            ).fetchone()
+        hits = contadores.get("hits", 0)
+        misses = contadores.get("misses", 0)
+        consultas = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "despejos": contadores.get("despejos", 0),
+            "taxa_acerto": hits / consultas if consultas else 0.0,
+            "entradas": total,
+            "bytes": tamanho,
+        }
+
+    def limpar(self):
+        with self._conectar() as con:
+            con.execute("DELETE FROM resultados")
+            con.execute("DELETE FROM contadores")
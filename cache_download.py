@@ -0,0 +1,111 @@
+import glob
+import os
+import re
+import threading
+import uuid
+
+PASTA_PADRAO = os.environ.get("CACHE_DOWNLOAD", os.path.join(".cache", "downloads"))
+MAX_BYTES_PADRAO = int(os.environ.get("CACHE_DOWNLOAD_MAX_MB", 500)) * 1024 * 1024
+
+_PADROES_VIDEO_ID = [
+    r"(?:v=|/v/|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})",
+    r"^([A-Za-z0-9_-]{11})$",
+]
+
+# ----------------- CHAVES -----------------
+
+def normalizar_video_id(video_url):
+    # youtube.com/watch?v=ID&t=1, youtu.be/ID?si=..., /shorts/ID... -> ID
+    texto = video_url.strip()
+    for padrao in _PADROES_VIDEO_ID:
+        match = re.search(padrao, texto)
+        if match:
+            return match.group(1)
+    raise ValueError(f"Não foi possível extrair o ID do vídeo: {video_url}")
+
+# ----------------- CACHE DE DOWNLOADS -----------------
+
+class CacheDownload:
+    def __init__(self, pasta=PASTA_PADRAO, max_bytes=MAX_BYTES_PADRAO):
+        self.pasta = pasta
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.despejos = 0
+        self._trava = threading.Lock()
+        os.makedirs(pasta, exist_ok=True)
+
+    def _entradas(self, chave="*"):
+        # Entrada = "<chave>.<ext>"; arquivos parciais ("<chave>.<ext>.<...>") nunca contam
+        return [c for c in glob.glob(os.path.join(self.pasta, f"{chave}.*"))
+                if os.path.basename(c).count(".") == 1]
+
+    def caminho_para(self, chave, extensao):
+        return os.path.join(self.pasta, f"{chave}.{extensao.lstrip('.')}")
+
+    def obter(self, chave):
+        for caminho in self._entradas(glob.escape(chave)):
+            try:
+                # mtime marca o último uso: é a ordem do LRU
+                os.utime(caminho)
+            except FileNotFoundError:
+                continue
+            with self._trava:
+                self.hits += 1
+            return caminho
+        with self._trava:
+            self.misses += 1
+        return None
+
+    def gravar(self, chave, extensao, dados):
+        # Escreve num nome único e renomeia: leitores nunca veem um arquivo pela metade,
+        # e dois downloads simultâneos do mesmo vídeo não se corrompem
+        destino = self.caminho_para(chave, extensao)
+        parcial = f"{destino}.{uuid.uuid4().hex}.parte"
+        try:
+            with open(parcial, "wb") as f:
+                f.write(dados)
+            os.replace(parcial, destino)
+        finally:
+            if os.path.exists(parcial):
+                os.remove(parcial)
+        self.registrar(destino)
+        return destino
+
+    def registrar(self, caminho):
+        # Para arquivos já gravados direto na pasta (ex.: download em streaming com rename)
+        os.utime(caminho)
+        self._despejar(manter=caminho)
+
+    def _despejar(self, manter=None):
+        with self._trava:
+            entradas = []
+            for caminho in self._entradas():
+                try:
+                    info = os.stat(caminho)
+                except FileNotFoundError:
+                    continue
+                entradas.append((info.st_mtime, info.st_size, caminho))
+            total = sum(tamanho for _, tamanho, _ in entradas)
+            for _, tamanho, caminho in sorted(entradas):
+                if total <= self.max_bytes:
+                    break
+                if caminho == manter:
+                    continue
+                try:
+                    # No Linux quem já abriu o arquivo continua lendo mesmo após a remoção
+                    os.remove(caminho)
+                except FileNotFoundError:
+                    pass
+                total -= tamanho
+                self.despejos += 1
+
+    def estatisticas(self):
+        entradas = self._entradas()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "despejos": self.despejos,
+            "entradas": len(entradas),
+            "bytes": sum(os.path.getsize(c) for c in entradas if os.path.exists(c)),
+        }
@@ -0,0 +1,146 @@
+import json
+import os
+import re
+from typing import NamedTuple, Optional
+
+import repertorio
+from busca import normalizar
+
+VERSAO_FORMATO = 1
+CAMINHO_CACHE = os.environ.get("CACHE_CATALOGO", os.path.join(".cache", "catalogo.json"))
+
+# ----------------- REGISTRO -----------------
+
+class Musica(NamedTuple):
+    # Tupla: compacta, imutável e serializa direto para lista no JSON
+    id: str
+    original: str
+    titulo: str
+    artistas: tuple = ()
+    hino: Optional[int] = None
+    aliases: tuple = ()
+    letra: str = ""
+    bpm: Optional[float] = None
+    tom: Optional[str] = None
+
+# ----------------- PARSER -----------------
+
+_PARENTESE_FINAL = re.compile(r"\s*\(([^()]*)\)\s*$")
+_HINO = re.compile(r"^hino\s+(\d+)$", re.IGNORECASE)
+_SEPARADOR_ARTISTAS = re.compile(r"\s*/\s*|\s*,\s*|\s+e\s+")
+
+def gerar_id(texto):
+    return normalizar(texto).replace(" ", "-")
+
+def interpretar(original, letra=""):
+    # "Título - Nome alternativo (Nome em inglês) (Artista / Artista e Artista)" ou "(hino 042)"
+    base = original.strip()
+    grupos = []
+    while True:
+        match = _PARENTESE_FINAL.search(base)
+        if not match:
+            break
+        grupos.insert(0, match.group(1).strip())
+        base = base[:match.start()].strip()
+
+    artistas, hino, aliases = (), None, []
+    if grupos:
+        ultimo = grupos.pop()
+        match = _HINO.match(ultimo)
+        if match:
+            hino = int(match.group(1))
+        else:
+            artistas = tuple(a for a in _SEPARADOR_ARTISTAS.split(ultimo) if a)
+        aliases.extend(grupos)
+
+    partes = [p.strip() for p in base.split(" - ")]
+    titulo = partes[0]
+    aliases.extend(partes[1:])
+    # Medleys ("Louvemos ao Senhor / Magnifiquemos / ...") também respondem por cada parte
+    medley = [p.strip() for p in titulo.split("/") if p.strip()]
+    if len(medley) > 1:
+        aliases.extend(medley)
+
+    return Musica(
+        id=gerar_id(original),
+        original=original,
+        titulo=titulo,
+        artistas=artistas,
+        hino=hino,
+        aliases=tuple(aliases),
+        letra=letra,
+    )
+
+def _listas_por_letra():
+    # As listas musicas_X de repertorio.py, na ordem em que aparecem no arquivo
+    return [(nome[len("musicas_"):], lista) for nome, lista in vars(repertorio).items()
+            if nome.startswith("musicas_") and isinstance(lista, list)]
+
+def interpretar_repertorio():
+    return [interpretar(m, letra) for letra, lista in _listas_por_letra() for m in lista]
+
+# ----------------- CACHE SERIALIZADO -----------------
+
+def _assinatura():
+    return {"versao": VERSAO_FORMATO, "mtime": os.path.getmtime(repertorio.__file__)}
+
+def carregar_musicas(caminho_cache=CAMINHO_CACHE):
+    # Lê o catálogo já interpretado se repertorio.py não mudou desde a última gravação
+    assinatura = _assinatura()
+    try:
+        with open(caminho_cache, encoding="utf-8") as f:
+            dados = json.load(f)
+        if dados.get("assinatura") == assinatura:
+            return [Musica(m[0], m[1], m[2], tuple(m[3]), m[4], tuple(m[5]), *m[6:])
+                    for m in dados["musicas"]]
+    except (OSError, ValueError, KeyError, IndexError, TypeError):
+        pass
+
+    musicas = interpretar_repertorio()
+    try:
+        pasta = os.path.dirname(caminho_cache)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        parcial = f"{caminho_cache}.{os.getpid()}.parte"
+        with open(parcial, "w", encoding="utf-8") as f:
+            json.dump({"assinatura": assinatura, "musicas": musicas}, f, ensure_ascii=False)
+        os.replace(parcial, caminho_cache)
+    except OSError:
+        pass  # Sem disco gravável o catálogo continua funcionando, só não fica em cache
+    return musicas
+
+# ----------------- CATÁLOGO -----------------
+
+class Catalogo:
+    def __init__(self, musicas):
+        self.musicas = tuple(musicas)
+        self._por_id = {m.id: m for m in self.musicas}
+        self._por_original = {m.original: m for m in self.musicas}
+        self._por_letra = {}
+        for m in self.musicas:
+            self._por_letra.setdefault(m.letra, []).append(m)
+
+    def __len__(self):
+        return len(self.musicas)
+
+    def __iter__(self):
+        return iter(self.musicas)
+
+    def por_id(self, musica_id):
+        return self._por_id.get(musica_id)
+
+    def por_original(self, texto):
+        return self._por_original.get(texto)
+
+    def por_letra(self, letra):
+        return list(self._por_letra.get(letra.upper(), []))
+
+    def letras(self):
+        return list(self._por_letra)
+
+    def titulos(self):
+        # Lista plana equivalente ao REPERTORIO antigo
+        return [m.original for m in self.musicas]
+
+CATALOGO = Catalogo(carregar_musicas())
+REPERTORIO = CATALOGO.titulos()
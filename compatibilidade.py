@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+from busca import buscar_musicas
+from catalogo import CATALOGO
+from tonalidade import NOMES_TONALIDADES
+
+# O que o app salva vai para CAMINHO_ATRIBUTOS. No Heroku (variável DYNO definida) esse disco é
+# efêmero: some a cada reinício e não é visto pelos outros dynos. O que sobrevive é
+# ATRIBUTOS_VERSIONADOS, que vai junto com o código; exporte a base pelo app e versione o arquivo
+CAMINHO_ATRIBUTOS = os.environ.get(
+    "ATRIBUTOS_REPERTORIO", os.path.join(".cache", "atributos_repertorio.json")
+)
+ATRIBUTOS_VERSIONADOS = os.environ.get(
+    "ATRIBUTOS_VERSIONADOS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "atributos_repertorio.json"),
+)
+DISCO_EFEMERO = "DYNO" in os.environ
+TOLERANCIA_BPM = 5.0
+COMPATIBILIDADE_MINIMA = 0.6
+
+# ----------------- COMPATIBILIDADE ENTRE TONS -----------------
+
+# Pesos de transição no círculo das quintas (roda de Camelot):
+#   mesmo tom 1.0 · relativo (C maior <-> A menor) 0.9 · quinta acima/abaixo 0.8
+#   quinta do relativo (C maior <-> E menor / D menor) 0.6 · homônimo (C maior <-> C menor) 0.5
+PESO_MESMO_TOM = 1.0
+PESO_RELATIVO = 0.9
+PESO_QUINTA = 0.8
+PESO_QUINTA_RELATIVO = 0.6
+PESO_HOMONIMO = 0.5
+
+def _posicao_quintas(indice):
+    # Índices de NOMES_TONALIDADES (0-11 maiores, 12-23 menores) -> (posição 0-11 no círculo, modo)
+    tonica, menor = indice % 12, indice >= 12
+    relativa_maior = (tonica + 3) % 12 if menor else tonica
+    return (relativa_maior * 7) % 12, menor
+
+def _matriz_compatibilidade():
+    matriz = np.zeros((24, 24), dtype=np.float32)
+    for a in range(24):
+        pos_a, menor_a = _posicao_quintas(a)
+        for b in range(24):
+            pos_b, menor_b = _posicao_quintas(b)
+            distancia = min((pos_a - pos_b) % 12, (pos_b - pos_a) % 12)
+            if a == b:
+                peso = PESO_MESMO_TOM
+            elif distancia == 0:
+                peso = PESO_RELATIVO
+            elif distancia == 1:
+                peso = PESO_QUINTA if menor_a == menor_b else PESO_QUINTA_RELATIVO
+            elif a % 12 == b % 12:
+                peso = PESO_HOMONIMO
+            else:
+                peso = 0.0
+            matriz[a, b] = peso
+    return matriz
+
+MATRIZ_COMPATIBILIDADE = _matriz_compatibilidade()
+
+def indice_tonalidade(nome):
+    # "A menor" -> 21; None/desconhecido -> -1
+    try:
+        return NOMES_TONALIDADES.index(nome)
+    except ValueError:
+        return -1
+
+def tonalidade_do_resumo(resumo):
+    if resumo.get("tonalidades"):
+        return resumo["tonalidades"][0][0]
+    # Resumos sem a estimativa de Krumhansl só têm a nota dominante; assume maior
+    return f"{resumo['tom']} maior" if resumo.get("tom") else None
+
+# ----------------- BASE DE ATRIBUTOS -----------------
+
+class BaseAtributos:
+    # BPM e tonalidade de cada música do repertório já analisada, em vetores alinhados
+    # com CATALOGO.musicas para que as consultas sejam operações numpy sobre tudo de uma vez
+    def __init__(self, caminho=CAMINHO_ATRIBUTOS, catalogo=CATALOGO, versionado=ATRIBUTOS_VERSIONADOS):
+        self.caminho = caminho
+        self.catalogo = catalogo
+        self.musicas = catalogo.musicas
+        self._posicao = {m.id: i for i, m in enumerate(self.musicas)}
+        self.bpm = np.full(len(self.musicas), np.nan, dtype=np.float32)
+        self.tom = np.full(len(self.musicas), -1, dtype=np.int16)
+        self._trava = threading.Lock()
+        # O arquivo versionado é a base; o local (salvo neste disco) sobrepõe música a música
+        if versionado and os.path.abspath(versionado) != os.path.abspath(caminho):
+            self._carregar(versionado)
+        self._carregar(caminho)
+
+    def _carregar(self, caminho):
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                dados = json.load(f)
+        except (OSError, ValueError):
+            return
+        for musica_id, atributos in dados.items():
+            i = self._posicao.get(musica_id)
+            if i is None:
+                continue  # Música removida do repertório
+            self.bpm[i] = atributos.get("bpm") or np.nan
+            self.tom[i] = indice_tonalidade(atributos.get("tonalidade"))
+
+    def dados(self):
+        dados = {}
+        for i in np.flatnonzero(~np.isnan(self.bpm) | (self.tom >= 0)):
+            dados[self.musicas[i].id] = {
+                "bpm": None if np.isnan(self.bpm[i]) else round(float(self.bpm[i]), 1),
+                "tonalidade": NOMES_TONALIDADES[self.tom[i]] if self.tom[i] >= 0 else None,
+            }
+        return dados
+
+    def exportar(self):
+        # Mesmo formato do arquivo salvo: serve de ATRIBUTOS_VERSIONADOS
+        return json.dumps(self.dados(), ensure_ascii=False, indent=1)
+
+    def salvar(self):
+        pasta = os.path.dirname(self.caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        parcial = f"{self.caminho}.{os.getpid()}.parte"
+        with open(parcial, "w", encoding="utf-8") as f:
+            f.write(self.exportar())
+        os.replace(parcial, self.caminho)
+
+    def __len__(self):
+        return int(np.count_nonzero(~np.isnan(self.bpm)))
+
+    def registrar(self, musica_id, bpm=None, tonalidade=None, salvar=True):
+        if musica_id not in self._posicao:
+            raise KeyError(f"Música fora do repertório: {musica_id}")
+        i = self._posicao[musica_id]
+        with self._trava:
+            if bpm is not None:
+                self.bpm[i] = bpm
+            if tonalidade is not None:
+                self.tom[i] = indice_tonalidade(tonalidade)
+            if salvar:
+                self.salvar()
+
+    def registrar_resumo(self, musica_id, resumo, salvar=True):
+        # `resumo` é o dicionário de ResultadoAnalise.resumo() (cache, lote, serviço HTTP)
+        self.registrar(musica_id, resumo.get("tempo"), tonalidade_do_resumo(resumo), salvar)
+
+    def atributos(self, musica):
+        # Registro do catálogo com bpm/tom preenchidos quando a música já foi analisada
+        i = self._posicao[musica.id]
+        return musica._replace(
+            bpm=None if np.isnan(self.bpm[i]) else round(float(self.bpm[i]), 1),
+            tom=NOMES_TONALIDADES[self.tom[i]] if self.tom[i] >= 0 else None,
+        )
+
+    def compativeis(self, bpm, tonalidade=None, tolerancia=TOLERANCIA_BPM,
+                    minimo=COMPATIBILIDADE_MINIMA, limite=20, excluir=None):
+        # Músicas a ±tolerancia BPM e, se informado o tom, com transição harmônica suave.
+        # Ordena por compatibilidade do tom e depois pela diferença de andamento.
+        delta = np.abs(self.bpm - np.float32(bpm))
+        selecao = delta <= tolerancia  # NaN (sem análise) nunca passa
+        indice = indice_tonalidade(tonalidade) if tonalidade else -1
+        if indice >= 0:
+            compat = np.where(self.tom >= 0, MATRIZ_COMPATIBILIDADE[indice][self.tom], 0.0)
+            selecao &= compat >= minimo
+        else:
+            compat = np.ones(len(self.musicas), dtype=np.float32)
+        if excluir is not None and excluir.id in self._posicao:
+            selecao[self._posicao[excluir.id]] = False
+
+        candidatos = np.flatnonzero(selecao)
+        ordem = candidatos[np.lexsort((delta[candidatos], -compat[candidatos]))]
+        if limite:
+            ordem = ordem[:limite]
+        return [
+            {
+                "musica": self.atributos(self.musicas[i]),
+                "compatibilidade": round(float(compat[i]), 2),
+                "diferenca_bpm": round(float(self.bpm[i] - bpm), 1),
+            }
+            for i in ordem
+        ]
+
+# ----------------- IMPORTAÇÃO -----------------
+
+def importar_resultados(caminho_saida, base=None):
+    # Lê a saída JSONL do lote.py e associa cada arquivo à música do repertório
+    # cujo título melhor casa com o nome do arquivo
+    base = BaseAtributos() if base is None else base
+    importados, ignorados = 0, []
+    with open(caminho_saida, encoding="utf-8") as f:
+        for linha in f:
+            if not linha.strip():
+                continue
+            registro = json.loads(linha)
+            if registro.get("erro"):
+                continue
+            nome = os.path.splitext(os.path.basename(registro["arquivo"]))[0]
+            encontradas = buscar_musicas(nome, limite=1)
+            if not encontradas:
+                ignorados.append(registro["arquivo"])
+                continue
+            base.registrar_resumo(CATALOGO.por_original(encontradas[0]).id, registro, salvar=False)
+            importados += 1
+    if importados:
+        base.salvar()
+    return importados, ignorados
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Músicas do repertório compatíveis em BPM e tom.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    importar = comandos.add_parser("importar", help="importa a saída .jsonl do lote.py")
+    importar.add_argument("saida", help="arquivo .jsonl gerado pelo lote.py")
+
+    buscar = comandos.add_parser("buscar", help="lista músicas compatíveis")
+    buscar.add_argument("bpm", type=float)
+    buscar.add_argument("tonalidade", nargs="?", help='ex.: "A menor"')
+    buscar.add_argument("-t", "--tolerancia", type=float, default=TOLERANCIA_BPM)
+    args = parser.parse_args(argv)
+
+    base = BaseAtributos()
+    if args.comando == "importar":
+        importados, ignorados = importar_resultados(args.saida, base)
+        print(f"✅ {importados} música(s) importada(s); {len(ignorados)} sem correspondência",
+              file=sys.stderr)
+        for caminho in ignorados:
+            print(f"   ⚠ {caminho}", file=sys.stderr)
+        return 0
+
+    for item in base.compativeis(args.bpm, args.tonalidade, args.tolerancia, limite=None):
+        musica = item["musica"]
+        print(f"{musica.bpm:6.1f}  {musica.tom or '-':9}  {item['compatibilidade']:.1f}  {musica.original}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+
+FFMPEG = os.environ.get("FFMPEG", "ffmpeg")
+FFPROBE = os.environ.get("FFPROBE", "ffprobe")
+MAX_BYTES_AUDIO = int(os.environ.get("ANALISE_MAX_UPLOAD", 50 * 1024 * 1024))
+MAX_DURACAO_AUDIO = float(os.environ.get("ANALISE_MAX_DURACAO", 20 * 60))         # segundos
+MEMORIA_MAX_FFMPEG_MB = int(os.environ.get("ANALISE_FFMPEG_MEMORIA_MB", 512))
+TIMEOUT_SONDAGEM = 10
+AMOSTRAS_POR_LEITURA = 65536
+
+class AudioRecusado(ValueError):
+    pass
+
+class AudioGrandeDemais(AudioRecusado):
+    # Passou do limite de tamanho ou de duração
+    pass
+
+class AudioInvalido(AudioRecusado):
+    # Ilegível ou sem faixa de áudio
+    pass
+
+@contextmanager
+def decodificavel():
+    # Nenhum leitor entende o arquivo (sem backend do audioread, stream corrompido): é um
+    # problema do upload, não do serviço -> AudioInvalido (415 na API) também vindo do processo
+    # de análise, onde a sondagem sem ffprobe não tinha como recusá-lo antes
+    import audioread
+
+    try:
+        yield
+    except (audioread.exceptions.DecodeError, RuntimeError, EOFError) as e:
+        raise AudioInvalido(f"Não foi possível decodificar o áudio: {str(e) or type(e).__name__}.") from e
+
+# ----------------- ARQUIVOS TEMPORÁRIOS -----------------
+
+def pasta_temporaria():
+    # /dev/shm é tmpfs no Linux: o arquivo fica em memória, sem ida e volta ao disco
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+@contextmanager
+def arquivo_temporario(dados, sufixo=""):
+    # Nome único por chamada: dois uploads com o mesmo nome não colidem
+    fd, caminho = tempfile.mkstemp(prefix="music_", suffix=sufixo, dir=pasta_temporaria())
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(dados)
+        yield caminho
+    finally:
+        if os.path.exists(caminho):
+            os.remove(caminho)
+
+# ----------------- DECODIFICAÇÃO EM MEMÓRIA -----------------
+
+def como_arquivo(fonte):
+    # UploadedFile do Streamlit já é um BytesIO: usa o próprio objeto, sem cópia.
+    # bytes vira BytesIO compartilhando o buffer; memoryview/bytearray precisam de uma cópia.
+    if hasattr(fonte, "read") and hasattr(fonte, "seek"):
+        fonte.seek(0)
+        return fonte
+    if not isinstance(fonte, bytes):
+        fonte = bytes(fonte)
+    return io.BytesIO(fonte)
+
+def conteudo(fonte):
+    if hasattr(fonte, "getbuffer"):
+        return fonte.getbuffer()
+    if hasattr(fonte, "read"):
+        fonte.seek(0)
+        return fonte.read()
+    return fonte
+
+def carregar_de_memoria(fonte, sr=22050, duracao=None, res_type="kaiser_best", dtype="float32"):
+    import librosa
+
+    # soundfile lê WAV/FLAC/OGG/MP3 direto do buffer; M4A/AAC precisam do audioread,
+    # que só aceita caminho -> arquivo temporário único em tmpfs
+    try:
+        return librosa.load(como_arquivo(fonte), sr=sr, mono=True, duration=duracao,
+                            dtype=dtype, res_type=res_type)
+    except RuntimeError:
+        pass
+    sufixo = os.path.splitext(getattr(fonte, "name", "") or "")[1]
+    with arquivo_temporario(conteudo(fonte), sufixo) as caminho, decodificavel():
+        return librosa.load(caminho, sr=sr, mono=True, duration=duracao,
+                            dtype=dtype, res_type=res_type)
+
+# ----------------- SONDAGEM E LIMITES -----------------
+
+def executavel(nome):
+    return shutil.which(nome) is not None
+
+@contextmanager
+def caminho_de(fonte):
+    # ffmpeg/ffprobe precisam de um arquivo com seek (o índice do M4A costuma ficar no fim)
+    if isinstance(fonte, (str, os.PathLike)):
+        yield fonte
+        return
+    sufixo = os.path.splitext(getattr(fonte, "name", "") or "")[1]
+    with arquivo_temporario(conteudo(fonte), sufixo) as caminho:
+        yield caminho
+
+def info_soundfile(fonte):
+    # Só o cabeçalho; None se o soundfile não reconhece o formato (M4A/AAC)
+    import soundfile as sf
+
+    try:
+        return sf.info(fonte if isinstance(fonte, (str, os.PathLike)) else como_arquivo(fonte))
+    except RuntimeError:
+        return None
+
+def tamanho_de(fonte):
+    if isinstance(fonte, (str, os.PathLike)):
+        return os.path.getsize(fonte)
+    return memoryview(conteudo(fonte)).nbytes
+
+def sondar(fonte):
+    info = info_soundfile(fonte)
+    if info is not None:
+        return {"leitor": "soundfile", "duracao": info.duration, "sr": info.samplerate,
+                "canais": info.channels}
+    if not executavel(FFPROBE):
+        # Sem ffprobe não há como saber antes de decodificar; vale só o limite de tamanho
+        return {"leitor": None, "duracao": None, "sr": None, "canais": None}
+
+    with caminho_de(fonte) as caminho:
+        r = subprocess.run(
+            [FFPROBE, "-v", "error", "-select_streams", "a:0",
+             "-show_entries", "format=duration:stream=sample_rate,channels", "-of", "json", caminho],
+            capture_output=True, timeout=TIMEOUT_SONDAGEM,
+        )
+    if r.returncode != 0:
+        raise AudioInvalido(f"Arquivo de áudio inválido: {r.stderr.decode(errors='replace').strip()}")
+    dados = json.loads(r.stdout or b"{}")
+    if not dados.get("streams"):
+        raise AudioInvalido("O arquivo não tem nenhuma faixa de áudio.")
+    faixa = dados["streams"][0]
+    duracao = dados.get("format", {}).get("duration")
+    return {"leitor": "ffmpeg", "duracao": float(duracao) if duracao else None,
+            "sr": int(faixa.get("sample_rate", 0)) or None, "canais": faixa.get("channels")}
+
+def verificar_limites(fonte, max_bytes=MAX_BYTES_AUDIO, max_duracao=MAX_DURACAO_AUDIO):
+    # Barato (tamanho + cabeçalho): roda antes de o arquivo ocupar um processo de análise
+    tamanho = tamanho_de(fonte)
+    if max_bytes and tamanho > max_bytes:
+        raise AudioGrandeDemais(
+            f"Arquivo de {tamanho / 1e6:.1f} MB: o limite é {max_bytes / 1e6:.0f} MB."
+        )
+    sondagem = sondar(fonte)
+    if max_duracao and sondagem["duracao"] and sondagem["duracao"] > max_duracao:
+        raise AudioGrandeDemais(
+            f"Áudio de {sondagem['duracao'] / 60:.1f} min: o limite é {max_duracao / 60:.1f} min."
+        )
+    return sondagem
+
+# ----------------- DECODIFICAÇÃO VIA FFMPEG -----------------
+
+def usar_ffmpeg(fonte):
+    # Formatos que o soundfile não lê (M4A/AAC) vão para o ffmpeg em vez do audioread
+    return executavel(FFMPEG) and info_soundfile(fonte) is None
+
+def _limitar_memoria(pid):
+    # O decodificador é outro processo: o limite do job não o alcança depois de iniciado
+    if not MEMORIA_MAX_FFMPEG_MB or not hasattr(resource, "prlimit"):
+        return
+    _, maximo = resource.getrlimit(resource.RLIMIT_AS)
+    limite = MEMORIA_MAX_FFMPEG_MB * 1024 * 1024
+    if maximo != resource.RLIM_INFINITY:
+        limite = min(limite, maximo)
+    try:
+        resource.prlimit(pid, resource.RLIMIT_AS, (limite, maximo))
+    except (OSError, ValueError):
+        pass  # Processo já terminou
+
+def pcm_ffmpeg(caminho, sr, duracao=None, amostras=AMOSTRAS_POR_LEITURA):
+    # PCM float32 mono já na taxa pedida, em pedaços; -t antes do -i faz o ffmpeg
+    # parar de ler a entrada no fim da janela em vez de decodificar a faixa inteira
+    comando = [FFMPEG, "-nostdin", "-hide_banner", "-loglevel", "error"]
+    if duracao:
+        comando += ["-t", str(duracao)]
+    comando += ["-i", os.fspath(caminho), "-vn", "-ac", "1", "-ar", str(sr), "-f", "f32le", "pipe:1"]
+    # stderr vai para um arquivo temporário, não para um pipe: um stream corrompido que loga
+    # um erro por frame encheria os 64 KB do pipe e travaria o ffmpeg (e quem lê o stdout)
+    with tempfile.TemporaryFile(dir=pasta_temporaria()) as erros:
+        processo = subprocess.Popen(comando, stdout=subprocess.PIPE, stderr=erros)
+        _limitar_memoria(processo.pid)
+        try:
+            while True:
+                dados = processo.stdout.read(amostras * 4)
+                if not dados:
+                    break
+                yield np.frombuffer(dados[:len(dados) // 4 * 4], dtype="<f4")
+            if processo.wait() != 0:
+                fim = erros.seek(0, os.SEEK_END)
+                erros.seek(max(0, fim - 4096))  # só o fim do log
+                raise AudioInvalido(f"ffmpeg falhou: {erros.read().decode(errors='replace').strip()}")
+        finally:
+            if processo.poll() is None:
+                processo.kill()
+            processo.wait()
+            processo.stdout.close()
+
+def decodificar_ffmpeg(fonte, sr, duracao=None):
+    with caminho_de(fonte) as caminho:
+        pedacos = list(pcm_ffmpeg(caminho, sr, duracao))
+    if not pedacos:
+        raise AudioInvalido("Arquivo de áudio vazio.")
+    return np.concatenate(pedacos)
@@ -0,0 +1,236 @@
+import io
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cache_download import CacheDownload, normalizar_video_id
+from metricas import REGISTRO, etapa
+
+URL_API_LOCAL = os.environ.get("MUSIC_API_URL", "http://127.0.0.1:8000")
+TIMEOUT = (3.05, 15)           # (conexão, leitura entre pacotes) em segundos
+TAMANHO_CHUNK = 64 * 1024
+COOKIES_YOUTUBE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cookies.txt")
+ABR_MAXIMO_KBPS = 320          # estimativa pessimista quando o formato não informa bitrate nem tamanho
+MARGEM_TRECHO = 1.15           # folga sobre a janela analisada (VBR, cabeçalhos do contêiner)
+CABECALHO_TRECHO = 64 * 1024
+
+# ----------------- SESSÃO HTTP -----------------
+
+_sessao = None
+_cache = None
+_trava_sessao = threading.Lock()
+
+def obter_cache_download():
+    global _cache
+    with _trava_sessao:
+        if _cache is None:
+            _cache = CacheDownload()
+    return _cache
+
+def obter_sessao():
+    # Uma sessão compartilhada: reaproveita conexões TCP/TLS entre downloads e provedores
+    global _sessao
+    with _trava_sessao:
+        if _sessao is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            sessao = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=1)
+            sessao.mount("http://", adaptador)
+            sessao.mount("https://", adaptador)
+            _sessao = sessao
+    return _sessao
+
+class DownloadCancelado(Exception):
+    pass
+
+def baixar_para_arquivo(url, destino, sessao=None, timeout=TIMEOUT, cancelado=None, **kwargs):
+    # Grava em pedaços num arquivo parcial e só renomeia no fim: memória constante,
+    # e quem lê `destino` nunca vê um arquivo pela metade
+    sessao = sessao or obter_sessao()
+    parcial = f"{destino}.{uuid.uuid4().hex}.parte"
+    try:
+        with sessao.get(url, stream=True, timeout=timeout, **kwargs) as r:
+            r.raise_for_status()
+            with open(parcial, "wb") as f:
+                for chunk in r.iter_content(TAMANHO_CHUNK):
+                    if cancelado is not None and cancelado.is_set():
+                        raise DownloadCancelado()
+                    f.write(chunk)
+        os.replace(parcial, destino)
+        return destino
+    finally:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+
+# ----------------- PROVEDORES -----------------
+
+class Provedor:
+    def __init__(self, nome, url, metodo="GET"):
+        self.nome = nome
+        self.url = url
+        self.metodo = metodo
+
+    def obter_link(self, video_url, sessao, timeout=TIMEOUT):
+        if self.metodo == "POST":
+            r = sessao.post(self.url, data={"url": video_url}, timeout=timeout)
+        else:
+            r = sessao.get(self.url, params={"url": video_url}, timeout=timeout)
+        r.raise_for_status()
+        dados = r.json()
+        if "url" not in dados:
+            raise ValueError("resposta sem link de download")
+        return dados["url"]
+
+PROVEDORES = [
+    # SaveFrom (exemplo de endpoint, pode mudar)
+    Provedor("SaveFrom", "https://worker.savefrom.net/api/convert"),
+    # Y2Mate (exemplo, normalmente precisa POST)
+    Provedor("Y2Mate", "https://www.y2mate.com/mates/en68/analyze/ajax", metodo="POST"),
+]
+
+# ----------------- TRECHO VIA YT-DLP -----------------
+
+def _tamanho_formato(formato):
+    return formato.get("filesize") or formato.get("filesize_approx")
+
+def escolher_formato_audio(info):
+    # Menor formato só-áudio servido por HTTP simples (Range funciona; HLS/DASH manifest não)
+    formatos = [
+        f for f in info.get("formats") or [info]
+        if f.get("url") and f.get("vcodec") == "none" and f.get("acodec") not in (None, "none")
+        and f.get("protocol", "https") in ("http", "https")
+    ]
+    if not formatos:
+        raise ValueError("Nenhum formato só de áudio disponível.")
+    return min(formatos, key=lambda f: (
+        _tamanho_formato(f) or float("inf"),
+        f.get("abr") or f.get("tbr") or ABR_MAXIMO_KBPS,
+    ))
+
+def bytes_para_janela(formato, duracao_total, janela):
+    tamanho = _tamanho_formato(formato)
+    if tamanho and duracao_total:
+        estimado = tamanho * janela / duracao_total
+    else:
+        kbps = formato.get("abr") or formato.get("tbr") or ABR_MAXIMO_KBPS
+        estimado = kbps * 125 * janela
+    total = int(estimado * MARGEM_TRECHO) + CABECALHO_TRECHO
+    return min(total, tamanho) if tamanho else total
+
+def baixar_intervalo(url, n_bytes, sessao=None, timeout=TIMEOUT, headers=None):
+    # Pede só os primeiros n_bytes; se o servidor ignorar o Range (200), corta a leitura ali
+    sessao = sessao or obter_sessao()
+    headers = dict(headers or {})
+    headers["Range"] = f"bytes=0-{n_bytes - 1}"
+    buffer = io.BytesIO()
+    with sessao.get(url, headers=headers, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        for chunk in r.iter_content(TAMANHO_CHUNK):
+            buffer.write(chunk[:n_bytes - buffer.tell()])
+            if buffer.tell() >= n_bytes:
+                break
+    buffer.seek(0)
+    return buffer
+
+def extrair_info_youtube(video_url):
+    import yt_dlp
+
+    opcoes = {"quiet": True, "no_warnings": True, "skip_download": True, "noplaylist": True}
+    if os.path.exists(COOKIES_YOUTUBE):
+        opcoes["cookiefile"] = COOKIES_YOUTUBE
+    with yt_dlp.YoutubeDL(opcoes) as ydl:
+        return ydl.extract_info(video_url, download=False)
+
+def baixar_trecho_youtube(video_url, janela=60, cache=None):
+    # Resolve o vídeo com o yt-dlp no próprio processo, escolhe o menor formato só-áudio e
+    # baixa apenas os bytes que cobrem a janela analisada. Devolve um BytesIO com .name,
+    # pronto para analisar_audio (que decodifica direto da memória), ou o caminho da
+    # cópia em cache, sem tocar na rede, se o vídeo já foi baixado.
+    cache = cache or obter_cache_download()
+    try:
+        chave = f"{normalizar_video_id(video_url)}-trecho{int(janela)}"
+    except ValueError:
+        chave = None  # URL fora do YouTube: baixa sem cache
+    caminho = cache.obter(chave) if chave else None
+    if caminho:
+        return caminho
+
+    with etapa("download_info"):
+        info = extrair_info_youtube(video_url)
+    formato = escolher_formato_audio(info)
+    n_bytes = bytes_para_janela(formato, info.get("duration"), janela)
+    with etapa("download_trecho", bytes_pedidos=n_bytes):
+        trecho = baixar_intervalo(formato["url"], n_bytes, headers=formato.get("http_headers"))
+    REGISTRO.contar("download_bytes_total", len(trecho.getbuffer()), "Bytes baixados", origem="trecho")
+    extensao = formato.get("ext", "m4a")
+    trecho.name = f"{info.get('id', 'youtube')}.{extensao}"
+    if chave:
+        cache.gravar(chave, extensao, trecho.getbuffer())
+    return trecho
+
+# ----------------- DOWNLOAD -----------------
+
+def baixar_audio_api(video_url, destino="musica.mp3", url_api=URL_API_LOCAL):
+    import requests
+
+    try:
+        return baixar_para_arquivo(f"{url_api}/baixar", destino, params={"video_url": video_url})
+    except requests.HTTPError as e:
+        raise Exception(f"Erro no download via API: {e.response.status_code}")
+
+def tentar_baixar_youtube(video_url, destino="musica.mp3", provedores=None, timeout=TIMEOUT):
+    # Dispara todos os provedores ao mesmo tempo e fica com o primeiro que terminar o download;
+    # os demais são avisados pelo evento e abandonam o arquivo parcial
+    provedores = PROVEDORES if provedores is None else provedores
+    sessao = obter_sessao()
+    vencedor = threading.Event()
+    trava = threading.Lock()
+
+    def tentar(provedor):
+        with etapa("download_provedor", provedor=provedor.nome):
+            link = provedor.obter_link(video_url, sessao, timeout)
+            parcial = baixar_para_arquivo(link, f"{destino}.{provedor.nome}", sessao, timeout, vencedor)
+        with trava:
+            if vencedor.is_set():
+                os.remove(parcial)
+                raise DownloadCancelado()
+            os.replace(parcial, destino)
+            vencedor.set()
+        REGISTRO.contar("download_bytes_total", os.path.getsize(destino), origem=provedor.nome)
+        return destino
+
+    tentativas = []
+    executor = ThreadPoolExecutor(max_workers=max(1, len(provedores)))
+    try:
+        futuros = {executor.submit(tentar, p): p for p in provedores}
+        for futuro in as_completed(futuros):
+            nome = futuros[futuro].nome
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                REGISTRO.contar("download_provedor_total", ajuda="Tentativas por provedor e situação",
+                                provedor=nome, situacao="erro")
+                tentativas.append(f"{nome} falhou: {e}")
+                continue
+            REGISTRO.contar("download_provedor_total", provedor=nome, situacao="ok")
+            return resultado
+    finally:
+        vencedor.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # Se todas falharem
+    raise Exception("Não consegui baixar automaticamente.\n\n" + "\n".join(tentativas))
+
+def baixar_youtube_com_cache(video_url, cache=None):
+    # Arquivo completo via provedores, guardado por ID do vídeo num caminho único
+    cache = cache or obter_cache_download()
+    chave = f"{normalizar_video_id(video_url)}-completo"
+    caminho = cache.obter(chave)
+    if caminho:
+        return caminho
+    destino = tentar_baixar_youtube(video_url, destino=cache.caminho_para(chave, "mp3"))
+    cache.registrar(destino)
+    return destino
@@ -0,0 +1,353 @@
+import io
+import multiprocessing
+import os
+import resource
+import signal
+import sys
+import threading
+import types
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from analise import PERFIL_PADRAO, analisar_audio
+from analise_continua import analisar_audio_continuo
+from decodificacao import verificar_limites
+from metricas import REGISTRO, coletar_etapas, configurar_logs, etapa, registrar_etapas, registrar_evento, rss_mb
+
+def _cpus_disponiveis():
+    # CPUs que este processo pode usar (os.cpu_count() num contêiner conta as do host)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def _memoria_total_mb():
+    # RAM do dyno/contêiner: DYNO_RAM (buildpack Python do Heroku), limite do cgroup
+    # (v2 ou v1) ou, sem nenhum dos dois, a memória física da máquina
+    fisica = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    if os.environ.get("DYNO_RAM"):
+        return int(os.environ["DYNO_RAM"])
+    for caminho in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(caminho) as f:
+                limite = f.read().strip()
+        except OSError:
+            continue
+        if limite.isdigit():
+            return min(fisica, int(limite) // (1024 * 1024))  # "sem limite" vem como um número enorme
+    return fisica
+
+MEMORIA_TOTAL_MB = _memoria_total_mb()
+MAX_PROCESSOS_PADRAO = 2
+# RSS medido com o cache do numba pronto: um processo de análise aquecido fica em ~320 MB
+# (o import do librosa/numba/scipy sozinho é ~250 MB; aquecer só o perfil padrão não muda
+# isso) e o processo principal do Streamlit em ~145 MB. Valores do ambiente têm precedência
+RSS_PROCESSO_MB = int(os.environ.get("ANALISE_RSS_PROCESSO_MB", 330))
+RSS_PRINCIPAL_MB = int(os.environ.get("ANALISE_RSS_PRINCIPAL_MB", 150))
+# O que um job precisa além da base do processo: o maior modo oferecido (preciso, ~+120 MB)
+# mais o upload copiado para o processo (até 50 MB)
+MEMORIA_JOB_MINIMA_MB = int(os.environ.get("ANALISE_MEMORIA_JOB_MINIMA_MB", 200))
+MEMORIA_JOB_MAXIMA_MB = 1536
+# Uploads em memória e sessões do processo principal, além do RSS medido na partida
+FOLGA_PRINCIPAL_MB = 64
+# Quantos processos cabem com a base de cada um mais um job, e nunca mais que MAX_PROCESSOS_PADRAO
+PROCESSOS_PADRAO = int(os.environ.get(
+    "ANALISE_PROCESSOS",
+    max(1, min(_cpus_disponiveis(), MAX_PROCESSOS_PADRAO,
+               (MEMORIA_TOTAL_MB - RSS_PRINCIPAL_MB) // (RSS_PROCESSO_MB + MEMORIA_JOB_MINIMA_MB))),
+))
+MAX_PENDENTES_PADRAO = int(os.environ.get("ANALISE_FILA_MAX", 2 * PROCESSOS_PADRAO))
+TTL_JOB = 600  # segundos que um resultado não buscado (sessão abandonada) fica guardado
+LIMITE_CPU_JOB = int(os.environ.get("ANALISE_LIMITE_CPU", 300))             # segundos de CPU por job
+# Relógio de parede por job: pega o que o limite de CPU não vê (processo parado num pipe)
+LIMITE_TEMPO_JOB = int(os.environ.get("ANALISE_LIMITE_TEMPO", 2 * LIMITE_CPU_JOB))
+
+def orcamento_job_mb(processos, rss_principal_mb=RSS_PRINCIPAL_MB, rss_processos_mb=None):
+    # Memória extra por job: o que sobra da RAM depois do processo principal e da base
+    # (ociosa) de cada processo de análise, dividido entre os processos
+    if rss_processos_mb is None:
+        rss_processos_mb = processos * RSS_PROCESSO_MB
+    livre = MEMORIA_TOTAL_MB - rss_principal_mb - rss_processos_mb
+    return int(min(MEMORIA_JOB_MAXIMA_MB, livre // processos))
+
+# Estimativa antes de os processos subirem; FilaAnalise recalcula com o RSS medido
+LIMITE_MEMORIA_JOB_MB = int(os.environ.get(
+    "ANALISE_LIMITE_MEMORIA_MB", max(0, orcamento_job_mb(PROCESSOS_PADRAO))
+))
+
+NA_FILA = "na_fila"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+
+class FilaCheia(Exception):
+    pass
+
+class LimiteExcedido(Exception):
+    pass
+
+class MemoriaInsuficiente(RuntimeError):
+    pass
+
+# ----------------- LIMITES POR JOB -----------------
+
+_limite_cpu_ativo = None   # segundos de CPU do job em execução; None entre jobs
+_limite_tempo_ativo = None # segundos de relógio do job em execução; None entre jobs
+
+def _estourou_cpu(signum, frame):
+    # SIGXCPU chega a cada segundo de CPU acima do limite "soft"; fora de um job é ignorado
+    if _limite_cpu_ativo is not None:
+        raise LimiteExcedido(f"A análise excedeu o limite de {_limite_cpu_ativo} s de CPU.")
+
+def _estourou_tempo(signum, frame):
+    if _limite_tempo_ativo is not None:
+        raise LimiteExcedido(f"A análise excedeu o limite de {_limite_tempo_ativo} s.")
+
+def _memoria_virtual():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+
+def _ajustar_limite(recurso, soft):
+    anterior = resource.getrlimit(recurso)
+    maximo = anterior[1]
+    if maximo != resource.RLIM_INFINITY:
+        soft = min(soft, maximo)
+    resource.setrlimit(recurso, (soft, maximo))
+    return anterior
+
+@contextmanager
+def limitar_recursos(cpu=LIMITE_CPU_JOB, memoria_mb=LIMITE_MEMORIA_JOB_MB, tempo=LIMITE_TEMPO_JOB):
+    # Limites relativos ao que o processo (que vive entre jobs) já consumiu. Só o "soft" muda:
+    # baixar o "hard" não tem volta sem root e o próximo job ficaria preso a ele.
+    # O de tempo é um SIGALRM: interrompe até uma leitura bloqueada (ex.: pipe do ffmpeg)
+    global _limite_cpu_ativo, _limite_tempo_ativo
+    anteriores = {}
+    try:
+        if cpu:
+            uso = resource.getrusage(resource.RUSAGE_SELF)
+            consumido = int(uso.ru_utime + uso.ru_stime) + 1
+            anteriores[resource.RLIMIT_CPU] = _ajustar_limite(resource.RLIMIT_CPU, consumido + cpu)
+        if memoria_mb:
+            anteriores[resource.RLIMIT_AS] = _ajustar_limite(
+                resource.RLIMIT_AS, _memoria_virtual() + memoria_mb * 1024 * 1024
+            )
+    except (OSError, ValueError):
+        pass  # Plataforma sem RLIMIT_AS (macOS) ou /proc: roda sem o limite
+    _limite_cpu_ativo = cpu if resource.RLIMIT_CPU in anteriores else None
+    # Só nos processos de análise (handler instalado): sem ele o SIGALRM mataria o processo
+    if (tempo and signal.getsignal(signal.SIGALRM) is _estourou_tempo
+            and threading.current_thread() is threading.main_thread()):
+        _limite_tempo_ativo = tempo
+        signal.setitimer(signal.ITIMER_REAL, tempo)
+    try:
+        yield
+    except MemoryError:
+        raise LimiteExcedido(f"A análise excedeu o limite de {memoria_mb} MB de memória.") from None
+    finally:
+        if _limite_tempo_ativo is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        _limite_cpu_ativo = _limite_tempo_ativo = None
+        for recurso, limite in anteriores.items():
+            resource.setrlimit(recurso, limite)
+
+# ----------------- PROCESSOS DE ANÁLISE -----------------
+
+def _iniciar_processo():
+    from aquecimento import aquecer
+
+    configurar_logs()
+    signal.signal(signal.SIGXCPU, _estourou_cpu)
+    signal.signal(signal.SIGALRM, _estourou_tempo)
+    # Cada processo paga o import do librosa e o JIT uma vez, antes do primeiro job real
+    aquecer(saida=io.StringIO())
+
+def _rss_ocioso():
+    # RSS do processo já aquecido: o initializer roda antes da primeira tarefa
+    return rss_mb()
+
+@contextmanager
+def _sem_script_principal():
+    # O spawn reexecuta o __main__ do processo pai em cada processo novo. Sob o Streamlit o
+    # __main__ é o próprio app.py: cada processo de análise montaria a página e abriria outra
+    # fila (RuntimeError do multiprocessing), morrendo antes do primeiro job. Os processos só
+    # precisam de fila.py; as funções submetidas vivem em módulos importáveis
+    principal = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = principal
+
+def executar_job(dados, nome, perfil=PERFIL_PADRAO, faixa_inteira=False, memoria_mb=LIMITE_MEMORIA_JOB_MB):
+    # Devolve o resumo e o detalhamento por etapa (tempo e memória medidos neste processo)
+    fonte = io.BytesIO(dados)
+    fonte.name = nome
+    with limitar_recursos(memoria_mb=memoria_mb), coletar_etapas() as etapas:
+        if faixa_inteira:
+            with etapa("analise", perfil="continuo"):
+                resumo = analisar_audio_continuo(fonte).resumo()
+        else:
+            resumo = analisar_audio(fonte, perfil).resumo()
+    return {"resumo": resumo, "etapas": etapas}
+
+def _concluir(futuro, timeout=None):
+    # Contabiliza no processo principal o que o processo de análise mediu
+    try:
+        saida = futuro.result(timeout=timeout)
+    except TimeoutError:
+        REGISTRO.contar("jobs_total", ajuda="Jobs concluídos por situação", situacao="timeout")
+        raise
+    except Exception:
+        REGISTRO.contar("jobs_total", ajuda="Jobs concluídos por situação", situacao=ERRO)
+        raise
+    REGISTRO.contar("jobs_total", ajuda="Jobs concluídos por situação", situacao=CONCLUIDO)
+    if isinstance(saida, dict) and "etapas" in saida:
+        registrar_etapas(saida["etapas"])
+    return saida
+
+# ----------------- FILA -----------------
+
+class FilaAnalise:
+    def __init__(self, processos=PROCESSOS_PADRAO, max_pendentes=MAX_PENDENTES_PADRAO, limite_memoria_mb=None):
+        self.processos = processos
+        self.max_pendentes = max_pendentes
+        self._pool = self._criar_pool()
+        self._jobs = {}
+        self._trava = threading.Lock()
+        if limite_memoria_mb is None and "ANALISE_LIMITE_MEMORIA_MB" not in os.environ:
+            limite_memoria_mb = self._medir_orcamento()
+        self.limite_memoria_mb = limite_memoria_mb or LIMITE_MEMORIA_JOB_MB
+
+    def _criar_pool(self):
+        # spawn: o servidor do Streamlit tem várias threads, e fork com threads é arriscado
+        pool = ProcessPoolExecutor(
+            max_workers=self.processos,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_iniciar_processo,
+        )
+        # O executor só cria um processo quando recebe uma tarefa e nenhum está livre: uma
+        # tarefa por processo sobe todos agora, sem o __main__ do pai
+        with _sem_script_principal():
+            self._partida = [pool.submit(_rss_ocioso) for _ in range(self.processos)]
+        return pool
+
+    def _medir_orcamento(self):
+        # Orçamento por job a partir do RSS real: deste processo (já com o Streamlit, se for o
+        # caso) e dos processos de análise aquecidos. Espera o aquecimento terminar
+        try:
+            rss_processos = round(max(f.result(timeout=LIMITE_TEMPO_JOB) for f in self._partida) * self.processos)
+        except Exception:
+            rss_processos = None  # Aquecimento falhou ou demorou: fica a estimativa
+        rss_principal = round(rss_mb()) + FOLGA_PRINCIPAL_MB
+        limite = orcamento_job_mb(self.processos, rss_principal, rss_processos)
+        registrar_evento("orcamento_memoria", memoria_total_mb=MEMORIA_TOTAL_MB, processos=self.processos,
+                         rss_principal_mb=rss_principal, rss_processos_mb=rss_processos,
+                         limite_job_mb=limite)
+        if limite < MEMORIA_JOB_MINIMA_MB:
+            self.encerrar()
+            raise MemoriaInsuficiente(
+                f"Memória insuficiente para analisar músicas: dos {MEMORIA_TOTAL_MB} MB, o processo "
+                f"principal usa {rss_principal} MB e {self.processos} processo(s) de análise ocioso(s) "
+                f"{rss_processos or self.processos * RSS_PROCESSO_MB} MB; sobram {limite} MB por "
+                f"análise e são necessários {MEMORIA_JOB_MINIMA_MB} MB. Use uma máquina com mais "
+                "memória ou menos processos (ANALISE_PROCESSOS)."
+            )
+        return limite
+
+    def _recriar_pool(self):
+        # Um processo morto (OOM killer, segfault) quebra o pool inteiro para sempre: os jobs
+        # dele já falharam com BrokenProcessPool; os próximos vão para um pool novo
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = self._criar_pool()
+        REGISTRO.contar("pool_recriado_total", ajuda="Pools de análise recriados após um processo morrer")
+        registrar_evento("pool_recriado", processos=self.processos)
+
+    def pendentes(self):
+        with self._trava:
+            return sum(1 for job in self._jobs.values() if not job["futuro"].done())
+
+    def _limpar_abandonados(self):
+        limite = time.time() - TTL_JOB
+        for job_id in [j for j, job in self._jobs.items() if job["futuro"].done() and job["criado"] < limite]:
+            del self._jobs[job_id]
+
+    def submeter(self, funcao, *args, **kwargs):
+        with self._trava:
+            self._limpar_abandonados()
+            pendentes = sum(1 for job in self._jobs.values() if not job["futuro"].done())
+            if pendentes >= self.max_pendentes:
+                raise FilaCheia(
+                    f"Servidor ocupado: {pendentes} análises em andamento. Tente novamente em instantes."
+                )
+            job_id = uuid.uuid4().hex
+            try:
+                futuro = self._pool.submit(funcao, *args, **kwargs)
+            except BrokenProcessPool:
+                self._recriar_pool()
+                futuro = self._pool.submit(funcao, *args, **kwargs)
+            self._jobs[job_id] = {"futuro": futuro, "criado": time.time()}
+        return job_id
+
+    def submeter_analise(self, dados, nome, perfil=PERFIL_PADRAO, faixa_inteira=False):
+        # Tamanho e duração conferidos aqui (AudioRecusado): um arquivo grande demais
+        # nunca chega a ocupar um processo de análise
+        dados = bytes(dados)
+        fonte = io.BytesIO(dados)
+        fonte.name = nome
+        verificar_limites(fonte)
+        return self.submeter(executar_job, dados, nome, perfil, faixa_inteira, self.limite_memoria_mb)
+
+    def status(self, job_id):
+        with self._trava:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            futuro = job["futuro"]
+            if futuro.done():
+                return ERRO if futuro.exception() is not None else CONCLUIDO
+            if futuro.running():
+                return EXECUTANDO
+            return NA_FILA
+
+    def posicao(self, job_id):
+        # Quantos jobs ainda não iniciados foram submetidos antes deste
+        with self._trava:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return sum(
+                1 for outro in self._jobs.values()
+                if outro["criado"] < job["criado"]
+                and not outro["futuro"].running() and not outro["futuro"].done()
+            )
+
+    def resultado(self, job_id):
+        # Retira o job da fila e devolve o resultado (ou relança a exceção do processo).
+        # Para submeter_analise: {"resumo": ..., "etapas": [...]}
+        with self._trava:
+            job = self._jobs.pop(job_id)
+        return _concluir(job["futuro"])
+
+    def aguardar(self, job_id, timeout=None):
+        # Versão bloqueante de resultado(), para quem não tem um laço de consulta (ex.: servico.py)
+        with self._trava:
+            futuro = self._jobs[job_id]["futuro"]
+        try:
+            return _concluir(futuro, timeout)
+        except TimeoutError:
+            futuro.cancel()
+            raise
+        finally:
+            with self._trava:
+                self._jobs.pop(job_id, None)
+
+    def cancelar(self, job_id):
+        with self._trava:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job["futuro"].cancel()
+
+    def encerrar(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,135 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+import numpy as np
+
+SR_CLIQUE = 44100
+DURACAO_CLIQUE = 0.03        # segundos de cada clique
+FREQ_CLIQUE = 1000.0
+FREQ_CLIQUE_FORTE = 1500.0   # primeiro tempo do compasso
+AMOSTRAS_BLOCO = 65536       # amostras por bloco gravado no WAV
+CAMPOS_GRADE = ["batida", "segundos", "intervalo", "bpm_local"]
+
+# ----------------- GRADE DE BATIDAS -----------------
+
+def grade_batidas(batidas):
+    # Uma linha por batida: posição, intervalo até a anterior e o BPM local correspondente
+    segundos = np.asarray(batidas, dtype=np.float64)
+    intervalos = np.diff(segundos, prepend=np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bpm_local = 60.0 / intervalos
+    return [
+        {
+            "batida": i + 1,
+            "segundos": round(float(t), 3),
+            "intervalo": None if np.isnan(d) else round(float(d), 3),
+            "bpm_local": None if not np.isfinite(b) else round(float(b), 1),
+        }
+        for i, (t, d, b) in enumerate(zip(segundos, intervalos, bpm_local))
+    ]
+
+def exportar_grade(batidas, destino, formato=None, tempo=None):
+    # JSON ({"tempo", "batidas"}) ou CSV; `destino` é caminho ou arquivo de texto aberto
+    if formato is None:
+        formato = "csv" if str(destino).lower().endswith(".csv") else "json"
+    linhas = grade_batidas(batidas)
+    if isinstance(destino, (str, os.PathLike)):
+        with open(destino, "w", newline="", encoding="utf-8") as f:
+            return exportar_grade(batidas, f, formato, tempo)
+    if formato == "csv":
+        escritor = csv.DictWriter(destino, fieldnames=CAMPOS_GRADE)
+        escritor.writeheader()
+        escritor.writerows(linhas)
+    else:
+        json.dump({"tempo": tempo, "batidas": linhas}, destino, ensure_ascii=False, indent=1)
+
+def grade_em_texto(batidas, formato="json", tempo=None):
+    buffer = io.StringIO()
+    exportar_grade(batidas, buffer, formato, tempo)
+    return buffer.getvalue()
+
+# ----------------- TRILHA DE CLIQUES -----------------
+
+def _formas_clique(sr):
+    # Senoide curta com decaimento exponencial: [fraco, forte]
+    t = np.arange(int(DURACAO_CLIQUE * sr)) / sr
+    envelope = np.exp(-t / (DURACAO_CLIQUE / 6))
+    return np.stack([
+        0.5 * envelope * np.sin(2 * np.pi * FREQ_CLIQUE * t),
+        0.8 * envelope * np.sin(2 * np.pi * FREQ_CLIQUE_FORTE * t),
+    ]).astype(np.float32)
+
+def blocos_clique(batidas, duracao, sr=SR_CLIQUE, compasso=4, amostras_bloco=AMOSTRAS_BLOCO):
+    # Gera a trilha bloco a bloco. Em cada bloco os cliques que o tocam viram uma matriz
+    # (cliques x amostras) de índices de destino; um np.add.at soma todos de uma vez
+    formas = _formas_clique(sr)
+    tamanho = formas.shape[1]
+    inicios = np.round(np.asarray(batidas, dtype=np.float64) * sr).astype(np.int64)
+    fortes = (np.arange(len(inicios)) % compasso == 0).astype(np.intp) if compasso else \
+        np.zeros(len(inicios), dtype=np.intp)
+    deslocamentos = np.arange(tamanho)
+    total = int(round(duracao * sr))
+
+    for inicio in range(0, total, amostras_bloco):
+        fim = min(inicio + amostras_bloco, total)
+        bloco = np.zeros(fim - inicio, dtype=np.float32)
+        a = np.searchsorted(inicios, inicio - tamanho, side="right")
+        b = np.searchsorted(inicios, fim, side="left")
+        if b > a:
+            posicoes = inicios[a:b, None] - inicio + deslocamentos
+            amostras = formas[fortes[a:b]]
+            dentro = (posicoes >= 0) & (posicoes < len(bloco))
+            np.add.at(bloco, posicoes[dentro], amostras[dentro])
+        yield bloco
+
+def gravar_clique(batidas, duracao, destino, sr=SR_CLIQUE, compasso=4):
+    # WAV 16 bits mono gravado por blocos: a memória não cresce com a duração da faixa.
+    # `destino` é caminho ou arquivo binário aberto (ex.: io.BytesIO para download)
+    import soundfile as sf
+
+    with sf.SoundFile(destino, "w", samplerate=sr, channels=1, subtype="PCM_16", format="WAV") as wav:
+        for bloco in blocos_clique(batidas, duracao, sr, compasso):
+            wav.write(bloco)
+
+def clique_em_memoria(batidas, duracao, sr=SR_CLIQUE, compasso=4):
+    buffer = io.BytesIO()
+    gravar_clique(batidas, duracao, buffer, sr, compasso)
+    return buffer.getvalue()
+
+# ----------------- CLI -----------------
+
+def main(argv=None):
+    from analise import PERFIL_PADRAO, PERFIS_ANALISE, analisar_audio
+
+    parser = argparse.ArgumentParser(description="Exporta a grade de batidas e uma trilha de cliques.")
+    parser.add_argument("audio", help="arquivo de áudio")
+    parser.add_argument("-g", "--grade", help="saída da grade de batidas (.json ou .csv)")
+    parser.add_argument("-c", "--clique", help="saída da trilha de cliques (.wav)")
+    parser.add_argument("-p", "--perfil", choices=list(PERFIS_ANALISE), default=PERFIL_PADRAO)
+    parser.add_argument("--inteira", action="store_true", help="analisa a faixa inteira (não só a janela do perfil)")
+    parser.add_argument("--compasso", type=int, default=4, help="tempos por compasso (0: sem acento)")
+    args = parser.parse_args(argv)
+
+    if args.inteira:
+        from analise_continua import analisar_audio_continuo
+        resultado = analisar_audio_continuo(args.audio)
+    else:
+        resultado = analisar_audio(args.audio, args.perfil, calcular_tom=False)
+    batidas = resultado.tempos_batidas()
+    print(f"🥁 {len(batidas)} batidas, {resultado.tempo:.1f} BPM", file=sys.stderr)
+
+    if args.grade:
+        exportar_grade(batidas, args.grade, tempo=resultado.tempo)
+    else:
+        exportar_grade(batidas, sys.stdout, "csv")
+    if args.clique:
+        gravar_clique(batidas, resultado.duracao, args.clique, compasso=args.compasso)
+        print(f"✅ Cliques gravados em {args.clique}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from analise import PERFIL_PADRAO, PERFIS_ANALISE, analisar_audio
+from tonalidade import formatar_tonalidade
+
+EXTENSOES_AUDIO = (".mp3", ".m4a", ".wav", ".flac", ".ogg")
+CAMPOS_CSV = ["arquivo", "perfil", "bpm_lista", "tom", "tonalidade", "tempo", "duracao", "erro"]
+
+# ----------------- FUNÇÕES -----------------
+
+def listar_audios(pasta):
+    for raiz, _, arquivos in os.walk(pasta):
+        for nome in sorted(arquivos):
+            if nome.lower().endswith(EXTENSOES_AUDIO):
+                yield os.path.join(raiz, nome)
+
+def analisar_arquivo(caminho, perfil=PERFIL_PADRAO):
+    # Executado nos processos do pool; nunca deixa a exceção derrubar o lote
+    try:
+        registro = analisar_audio(caminho, perfil).resumo()
+        registro["erro"] = None
+    except Exception as e:
+        registro = {"erro": f"{type(e).__name__}: {e}"}
+    registro["arquivo"] = caminho
+    return registro
+
+def _formato(caminho_saida):
+    return "csv" if caminho_saida.lower().endswith(".csv") else "jsonl"
+
+def _linhas_jsonl(f):
+    # Lote interrompido no meio de uma escrita deixa a última linha cortada: ignora
+    for l in f:
+        if not l.strip():
+            continue
+        try:
+            linha = json.loads(l)
+        except ValueError:
+            continue
+        if isinstance(linha, dict):
+            yield linha
+
+def _termina_com_quebra(caminho_saida):
+    with open(caminho_saida, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+def ja_processados(caminho_saida, perfil=PERFIL_PADRAO):
+    # Retomada: só conta como feito o arquivo que terminou sem erro no mesmo perfil
+    if not os.path.exists(caminho_saida):
+        return set()
+    feitos = set()
+    with open(caminho_saida, newline="", encoding="utf-8") as f:
+        if _formato(caminho_saida) == "csv":
+            # Linha cortada tem menos colunas que o cabeçalho: o DictReader completa com None
+            linhas = (l for l in csv.DictReader(f) if None not in l.values())
+        else:
+            linhas = _linhas_jsonl(f)
+        for linha in linhas:
+            if linha.get("arquivo") and not linha.get("erro") and (linha.get("perfil") or PERFIL_PADRAO) == perfil:
+                feitos.add(linha["arquivo"])
+    return feitos
+
+class EscritorResultados:
+    def __init__(self, caminho_saida):
+        self.formato = _formato(caminho_saida)
+        novo = not os.path.exists(caminho_saida) or os.path.getsize(caminho_saida) == 0
+        # Linha cortada no fim do arquivo: o próximo registro começa numa linha nova
+        cortado = not novo and not _termina_com_quebra(caminho_saida)
+        self.arquivo = open(caminho_saida, "a", newline="", encoding="utf-8")
+        if cortado:
+            self.arquivo.write("\n")
+        if self.formato == "csv":
+            self.csv = csv.DictWriter(self.arquivo, fieldnames=CAMPOS_CSV, extrasaction="ignore")
+            if novo:
+                self.csv.writeheader()
+
+    def escrever(self, registro):
+        if self.formato == "csv":
+            linha = dict(registro)
+            linha["bpm_lista"] = " ".join(str(b) for b in registro.get("bpm_lista") or [])
+            if registro.get("tonalidades"):
+                linha["tonalidade"] = formatar_tonalidade(registro["tonalidades"])
+            self.csv.writerow(linha)
+        else:
+            self.arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        # Grava a cada arquivo concluído: interromper o lote não perde o que já foi feito
+        self.arquivo.flush()
+
+    def fechar(self):
+        self.arquivo.close()
+
+def analisar_pasta(pasta, caminho_saida, processos=None, perfil=PERFIL_PADRAO):
+    feitos = ja_processados(caminho_saida, perfil)
+    pendentes = [c for c in listar_audios(pasta) if c not in feitos]
+    print(f"🎵 {len(pendentes)} arquivo(s) para analisar ({len(feitos)} já feitos)", file=sys.stderr)
+    if not pendentes:
+        return 0
+
+    escritor = EscritorResultados(caminho_saida)
+    erros = 0
+    try:
+        with ProcessPoolExecutor(max_workers=processos or os.cpu_count()) as pool:
+            futuros = [pool.submit(analisar_arquivo, c, perfil) for c in pendentes]
+            for i, futuro in enumerate(as_completed(futuros), 1):
+                registro = futuro.result()
+                escritor.escrever(registro)
+                if registro["erro"]:
+                    erros += 1
+                    print(f"[{i}/{len(pendentes)}] ❌ {registro['arquivo']}: {registro['erro']}", file=sys.stderr)
+                else:
+                    print(f"[{i}/{len(pendentes)}] ✅ {registro['arquivo']}", file=sys.stderr)
+    finally:
+        escritor.fechar()
+    return erros
+
+# ----------------- CLI -----------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analisa BPM e tom de todos os áudios de uma pasta.")
+    parser.add_argument("pasta", help="pasta com os arquivos de áudio (percorrida recursivamente)")
+    parser.add_argument("-o", "--saida", default="analises.jsonl",
+                        help="arquivo de saída .jsonl ou .csv (padrão: analises.jsonl)")
+    parser.add_argument("-j", "--processos", type=int, default=None,
+                        help="número de processos (padrão: número de CPUs)")
+    parser.add_argument("-p", "--perfil", choices=list(PERFIS_ANALISE), default=PERFIL_PADRAO,
+                        help=f"perfil de análise (padrão: {PERFIL_PADRAO})")
+    args = parser.parse_args(argv)
+
+    erros = analisar_pasta(args.pasta, args.saida, processos=args.processos, perfil=args.perfil)
+    return 1 if erros else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
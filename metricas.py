@@ -0,0 +1,241 @@
+import contextvars
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Limites (s) dos histogramas: de uma etapa de milissegundos a uma análise "preciso" inteira
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PREFIXO = "music_"
+# Processos sem rota /metrics própria (app Streamlit): medidores no log a cada intervalo e,
+# se houver porta, o mesmo texto do /metrics do serviço num servidor à parte
+INTERVALO_METRICAS = float(os.environ.get("ANALISE_METRICAS_INTERVALO", 60))
+PORTA_METRICAS = int(os.environ.get("ANALISE_METRICAS_PORTA", 0))
+AJUDA_ETAPAS = "Duração de cada etapa da análise e do download"
+
+logger = logging.getLogger("music.metricas")
+
+# ----------------- MEMÓRIA -----------------
+
+_PAGINA = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def rss_mb():
+    # RSS atual (Linux: /proc/self/statm); fora do Linux cai no pico do processo
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGINA / (1024 * 1024)
+    except OSError:
+        return rss_pico_mb()
+
+def rss_pico_mb():
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+# ----------------- REGISTRO (FORMATO PROMETHEUS) -----------------
+
+def _rotulos(rotulos):
+    return tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _formatar_rotulos(rotulos, extra=()):
+    pares = list(rotulos) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+class Registro:
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._ajuda = {}
+        self._contadores = {}      # nome -> {rotulos: valor}
+        self._histogramas = {}     # nome -> {rotulos: [contagens por limite..., acima do último, soma, total]}
+        self._medidores = {}       # nome -> função () -> valor ou {rotulos(dict como tupla): valor}
+
+    def _descrever(self, nome, ajuda):
+        if ajuda or nome not in self._ajuda:
+            self._ajuda[nome] = ajuda
+
+    def contar(self, nome, valor=1, ajuda="", **rotulos):
+        with self._trava:
+            self._descrever(nome, ajuda)
+            serie = self._contadores.setdefault(nome, {})
+            chave = _rotulos(rotulos)
+            serie[chave] = serie.get(chave, 0) + valor
+
+    def observar(self, nome, valor, ajuda="", **rotulos):
+        with self._trava:
+            self._descrever(nome, ajuda)
+            serie = self._histogramas.setdefault(nome, {})
+            baldes = serie.setdefault(_rotulos(rotulos), [0] * (len(LIMITES_SEGUNDOS) + 3))
+            # Baldes não cumulativos aqui; a exportação acumula. Acima do último limite cai
+            # em baldes[len(LIMITES_SEGUNDOS)], só contado no +Inf
+            baldes[bisect_left(LIMITES_SEGUNDOS, valor)] += 1
+            baldes[-2] += valor
+            baldes[-1] += 1
+
+    def medidor(self, nome, funcao, ajuda=""):
+        # Valor lido na hora da exportação (tamanho da fila, taxa de acerto do cache...)
+        with self._trava:
+            self._ajuda[nome] = ajuda
+            self._medidores[nome] = funcao
+
+    def ler_medidores(self):
+        # {nome: {rotulos: valor}} lido agora; um medidor quebrado não derruba a leitura inteira
+        with self._trava:
+            medidores = dict(self._medidores)
+        leituras = {}
+        for nome, funcao in sorted(medidores.items()):
+            try:
+                valor = funcao()
+            except Exception:
+                continue
+            leituras[nome] = valor if isinstance(valor, dict) else {(): valor}
+        return leituras
+
+    def exportar(self):
+        linhas = []
+        with self._trava:
+            contadores = {n: dict(s) for n, s in self._contadores.items()}
+            histogramas = {n: {r: list(b) for r, b in s.items()} for n, s in self._histogramas.items()}
+            ajuda = dict(self._ajuda)
+
+        def cabecalho(nome, tipo):
+            if ajuda.get(nome):
+                linhas.append(f"# HELP {PREFIXO}{nome} {ajuda[nome]}")
+            linhas.append(f"# TYPE {PREFIXO}{nome} {tipo}")
+
+        for nome, serie in sorted(contadores.items()):
+            cabecalho(nome, "counter")
+            for rotulos, valor in sorted(serie.items()):
+                linhas.append(f"{PREFIXO}{nome}{_formatar_rotulos(rotulos)} {valor}")
+
+        for nome, serie in sorted(histogramas.items()):
+            cabecalho(nome, "histogram")
+            for rotulos, baldes in sorted(serie.items()):
+                acumulado = 0
+                for limite, contagem in zip(LIMITES_SEGUNDOS, baldes):
+                    acumulado += contagem
+                    linhas.append(f"{PREFIXO}{nome}_bucket{_formatar_rotulos(rotulos, [('le', limite)])} "
+                                  f"{acumulado}")
+                linhas.append(f"{PREFIXO}{nome}_bucket{_formatar_rotulos(rotulos, [('le', '+Inf')])} "
+                              f"{baldes[-1]}")
+                linhas.append(f"{PREFIXO}{nome}_sum{_formatar_rotulos(rotulos)} {baldes[-2]:.6f}")
+                linhas.append(f"{PREFIXO}{nome}_count{_formatar_rotulos(rotulos)} {baldes[-1]}")
+
+        for nome, serie in self.ler_medidores().items():
+            cabecalho(nome, "gauge")
+            for rotulos, v in sorted(serie.items()):
+                linhas.append(f"{PREFIXO}{nome}{_formatar_rotulos(rotulos)} {float(v)}")
+
+        return "\n".join(linhas) + "\n"
+
+REGISTRO = Registro()
+
+# ----------------- ETAPAS -----------------
+
+_etapas = contextvars.ContextVar("etapas", default=None)
+
+@contextmanager
+def coletar_etapas():
+    # Junta numa lista as etapas medidas dentro do bloco (detalhamento de uma análise)
+    etapas = []
+    token = _etapas.set(etapas)
+    try:
+        yield etapas
+    finally:
+        _etapas.reset(token)
+
+def registrar_etapas(etapas):
+    # Etapas medidas em outro processo (pool de análise) entram no registro deste
+    for registro in etapas:
+        REGISTRO.observar("etapa_segundos", registro["segundos"], AJUDA_ETAPAS, etapa=registro["etapa"])
+
+@contextmanager
+def etapa(nome, **campos):
+    rss_antes = rss_mb()
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield
+    except BaseException as e:
+        erro = type(e).__name__
+        raise
+    finally:
+        rss_depois = rss_mb()
+        registro = {
+            "etapa": nome,
+            "segundos": round(time.perf_counter() - inicio, 4),
+            "rss_mb": round(rss_depois, 1),
+            "delta_rss_mb": round(rss_depois - rss_antes, 1),
+            **campos,
+        }
+        if erro:
+            registro["erro"] = erro
+        etapas = _etapas.get()
+        if etapas is not None:
+            etapas.append(registro)
+        REGISTRO.observar("etapa_segundos", registro["segundos"], AJUDA_ETAPAS, etapa=nome)
+        registrar_evento("etapa", **registro)
+
+# ----------------- LOGS -----------------
+
+def registrar_evento(evento, **campos):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"evento": evento, "ts": round(time.time(), 3), "pid": os.getpid(), **campos},
+                               ensure_ascii=False, default=str))
+
+def configurar_logs(nivel=None):
+    # Uma linha JSON por evento no stderr (o logger só emite JSON; o formato não acrescenta nada)
+    nivel = nivel or os.environ.get("ANALISE_LOG_NIVEL", "INFO")
+    if not logger.handlers:
+        manipulador = logging.StreamHandler()
+        manipulador.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(manipulador)
+        logger.propagate = False
+    logger.setLevel(nivel.upper())
+
+# ----------------- PUBLICAÇÃO -----------------
+
+class _ManipuladorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        corpo = REGISTRO.exportar().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):
+        pass  # Uma linha por coleta só poluiria o log de eventos
+
+def _serie_no_log(serie):
+    # Sem rótulos vira o próprio valor; com rótulos, {"cache=analise": valor, ...}
+    if list(serie) == [()]:
+        return serie[()]
+    return {",".join(f"{k}={v}" for k, v in rotulos): valor for rotulos, valor in serie.items()}
+
+def _registrar_medidores_periodicamente(intervalo):
+    while True:
+        time.sleep(intervalo)
+        registrar_evento("metricas", **{nome: _serie_no_log(serie)
+                                        for nome, serie in REGISTRO.ler_medidores().items()})
+
+def publicar_metricas(intervalo=INTERVALO_METRICAS, porta=PORTA_METRICAS, host="0.0.0.0"):
+    # Threads daemon: morrem com o processo, sem encerramento explícito
+    if intervalo > 0:
+        threading.Thread(target=_registrar_medidores_periodicamente, args=(intervalo,),
+                         name="metricas-log", daemon=True).start()
+    if not porta:
+        return None
+    servidor = ThreadingHTTPServer((host, porta), _ManipuladorMetricas)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="metricas-http", daemon=True).start()
+    return servidor
@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from analise import PERFIL_PADRAO, PERFIS_ANALISE
+from cache_analise import CacheAnalise, chave_analise
+from download import baixar_youtube_com_cache, obter_cache_download
+from decodificacao import AudioGrandeDemais, AudioInvalido, AudioRecusado
+from fila import LIMITE_TEMPO_JOB, PROCESSOS_PADRAO, FilaAnalise, FilaCheia, LimiteExcedido, MemoriaInsuficiente
+from metricas import REGISTRO, configurar_logs, registrar_evento
+
+HOST_PADRAO = "127.0.0.1"
+PORTA_PADRAO = 8000
+MAX_UPLOAD = int(os.environ.get("ANALISE_MAX_UPLOAD", 50 * 1024 * 1024))
+# Espera da requisição pela análise (s): acima do limite de tempo do job, para que quem
+# encerra uma análise longa seja o processo de análise (422) e não a espera daqui. Por padrão
+# cobre os jobs à frente na fila (até max_pendentes / processos por processo) mais o próprio
+FOLGA_TIMEOUT = 30
+TIMEOUT_ANALISE = int(os.environ.get("ANALISE_TIMEOUT", 0)) or None
+
+# ----------------- REQUISIÇÃO -----------------
+
+class ErroHTTP(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+def extrair_audio(corpo, content_type):
+    # Aceita corpo bruto (qualquer content-type) ou multipart/form-data com o primeiro arquivo
+    if not content_type.startswith("multipart/form-data"):
+        return corpo, ""
+    mensagem = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + corpo
+    )
+    for parte in mensagem.iter_parts():
+        if parte.get_filename():
+            return parte.get_payload(decode=True), parte.get_filename()
+    raise ErroHTTP(400, "Nenhum arquivo no formulário multipart.")
+
+class ManipuladorAnalise(BaseHTTPRequestHandler):
+    server_version = "MusicAnalise/1.0"
+
+    def send_response(self, code, message=None):
+        self.status_resposta = code
+        super().send_response(code, message)
+
+    def _responder_json(self, status, dados):
+        corpo = json.dumps(dados, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        if status == 503:
+            self.send_header("Retry-After", "5")
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _ler_corpo(self):
+        tamanho = self.headers.get("Content-Length")
+        if tamanho is None:
+            raise ErroHTTP(411, "Content-Length obrigatório.")
+        try:
+            tamanho = int(tamanho)
+        except ValueError:
+            tamanho = -1
+        if tamanho < 0:
+            # Negativo viraria rfile.read(-1): leitura até o EOF, sem limite nenhum
+            self.close_connection = True
+            raise ErroHTTP(400, "Content-Length inválido.")
+        # Recusa antes de ler: um upload gigante nunca chega à memória
+        if tamanho > self.server.max_upload:
+            self.close_connection = True
+            raise ErroHTTP(413, f"Arquivo maior que o limite de {self.server.max_upload} bytes.")
+        corpo = self.rfile.read(tamanho)
+        if len(corpo) < tamanho:
+            self.close_connection = True
+            raise ErroHTTP(400, "Corpo menor que o Content-Length.")
+        return corpo
+
+    def _tratar(self, metodo):
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        rota = self.server.rotas.get((metodo, url.path))
+        inicio = time.perf_counter()
+        self.status_resposta = None
+        try:
+            if rota is None:
+                raise ErroHTTP(404, f"Rota não encontrada: {metodo} {url.path}")
+            rota(self, params)
+        except ErroHTTP as e:
+            self._responder_json(e.status, {"erro": str(e)})
+        except FilaCheia as e:
+            self._responder_json(503, {"erro": str(e)})
+        except AudioGrandeDemais as e:
+            self._responder_json(413, {"erro": str(e)})
+        except AudioInvalido as e:
+            self._responder_json(415, {"erro": str(e)})
+        except AudioRecusado as e:
+            self._responder_json(400, {"erro": str(e)})
+        except LimiteExcedido as e:
+            self._responder_json(422, {"erro": str(e)})
+        except Exception as e:
+            self._responder_json(500, {"erro": f"{type(e).__name__}: {e}"})
+        finally:
+            # Rotas desconhecidas viram um único rótulo: o path do cliente não explode a cardinalidade
+            nome_rota = url.path if rota is not None else "desconhecida"
+            segundos = time.perf_counter() - inicio
+            REGISTRO.contar("http_requisicoes_total", ajuda="Requisições HTTP por rota e status",
+                            metodo=metodo, rota=nome_rota, status=self.status_resposta)
+            REGISTRO.observar("http_latencia_segundos", segundos, "Latência das requisições HTTP",
+                              rota=nome_rota)
+            registrar_evento("requisicao", metodo=metodo, rota=nome_rota, status=self.status_resposta,
+                             segundos=round(segundos, 4))
+
+    def do_GET(self):
+        self._tratar("GET")
+
+    def do_POST(self):
+        self._tratar("POST")
+
+# ----------------- ROTAS -----------------
+
+def rota_saude(handler, params):
+    fila = handler.server.fila
+    handler._responder_json(200, {
+        "ok": True,
+        "processos": fila.processos,
+        "pendentes": fila.pendentes(),
+        "cache": handler.server.cache.estatisticas(),
+    })
+
+def rota_analisar(handler, params):
+    perfil = params.get("perfil", PERFIL_PADRAO)
+    if perfil not in PERFIS_ANALISE:
+        raise ErroHTTP(400, f"Perfil desconhecido: {perfil}")
+    faixa_inteira = params.get("faixa_inteira", "").lower() in ("1", "true", "sim")
+
+    dados, nome = extrair_audio(handler._ler_corpo(), handler.headers.get("Content-Type", ""))
+    if not dados:
+        raise ErroHTTP(400, "Corpo vazio: envie o áudio no corpo ou como multipart.")
+    nome = params.get("nome", nome)
+
+    if faixa_inteira:
+        chave = chave_analise(dados, modo="continuo")
+    else:
+        chave = chave_analise(dados, **PERFIS_ANALISE[perfil].parametros())
+    cache = handler.server.cache
+    resumo = cache.obter(chave)
+    if resumo is None:
+        fila = handler.server.fila
+        job_id = fila.submeter_analise(dados, nome, perfil, faixa_inteira)
+        try:
+            resumo = fila.aguardar(job_id, timeout=handler.server.timeout_analise)["resumo"]
+        except TimeoutError:
+            # aguardar já cancelou o job se ele ainda estava na fila; em execução, o limite
+            # de tempo do próprio processo de análise o encerra
+            raise ErroHTTP(504, f"A análise não terminou em {handler.server.timeout_analise} s.")
+        cache.gravar(chave, resumo)
+    handler._responder_json(200, resumo)
+
+def rota_baixar(handler, params):
+    video_url = params.get("video_url", "").strip()
+    if not video_url:
+        raise ErroHTTP(400, "Informe video_url.")
+    try:
+        caminho = baixar_youtube_com_cache(video_url)
+    except Exception as e:
+        raise ErroHTTP(502, str(e))
+    # Abre antes de responder: mesmo que o cache despeje o arquivo agora, o descritor segue válido
+    with open(caminho, "rb") as f:
+        handler.send_response(200)
+        handler.send_header("Content-Type", "audio/mpeg")
+        handler.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+        handler.end_headers()
+        shutil.copyfileobj(f, handler.wfile)
+
+def rota_metricas(handler, params):
+    corpo = REGISTRO.exportar().encode()
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+    handler.send_header("Content-Length", str(len(corpo)))
+    handler.end_headers()
+    handler.wfile.write(corpo)
+
+ROTAS = {
+    ("GET", "/saude"): rota_saude,
+    ("GET", "/metrics"): rota_metricas,
+    ("POST", "/analyze"): rota_analisar,
+    ("GET", "/baixar"): rota_baixar,
+}
+
+# ----------------- SERVIDOR -----------------
+
+def timeout_analise(fila):
+    jobs_por_processo = -(-fila.max_pendentes // fila.processos)
+    return jobs_por_processo * LIMITE_TEMPO_JOB + FOLGA_TIMEOUT
+
+def criar_servidor(host=HOST_PADRAO, porta=PORTA_PADRAO, processos=PROCESSOS_PADRAO,
+                   max_pendentes=None, max_upload=MAX_UPLOAD, cache=None, timeout=TIMEOUT_ANALISE):
+    # A fila primeiro: sem memória para um job ela se recusa a subir (MemoriaInsuficiente)
+    fila = FilaAnalise(processos=processos, max_pendentes=max_pendentes or 2 * processos)
+    servidor = ThreadingHTTPServer((host, porta), ManipuladorAnalise)
+    servidor.daemon_threads = True
+    servidor.rotas = ROTAS
+    servidor.max_upload = max_upload
+    servidor.fila = fila
+    servidor.cache = cache or CacheAnalise()
+    servidor.timeout_analise = timeout or timeout_analise(fila)
+    registrar_medidores(servidor.fila, servidor.cache)
+    return servidor
+
+def registrar_medidores(fila, cache):
+    # Lidos a cada coleta do Prometheus (ou publicação no log, no app). Sem fila (app sem
+    # memória para um job) ficam só os caches
+    if fila is not None:
+        REGISTRO.medidor("fila_pendentes", fila.pendentes, "Análises na fila ou em execução")
+        REGISTRO.medidor("fila_capacidade", lambda: fila.max_pendentes, "Máximo de análises pendentes")
+        REGISTRO.medidor("fila_processos", lambda: fila.processos, "Processos de análise")
+
+    def caches():
+        analise = cache.estatisticas()
+        download = obter_cache_download().estatisticas()
+        consultas = download["hits"] + download["misses"]
+        return {
+            (("cache", "analise"),): analise["taxa_acerto"],
+            (("cache", "download"),): download["hits"] / consultas if consultas else 0.0,
+        }
+
+    REGISTRO.medidor("cache_taxa_acerto", caches, "Fração das consultas atendidas pelo cache")
+    REGISTRO.medidor("cache_entradas", lambda: {
+        (("cache", "analise"),): cache.estatisticas()["entradas"],
+        (("cache", "download"),): obter_cache_download().estatisticas()["entradas"],
+    }, "Entradas guardadas em cada cache")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço HTTP de análise de BPM e tom.")
+    parser.add_argument("--host", default=HOST_PADRAO)
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    parser.add_argument("-j", "--processos", type=int, default=PROCESSOS_PADRAO,
+                        help="processos de análise (padrão: ANALISE_PROCESSOS ou quantos cabem na RAM com um job cada, "
+                             "até o número de CPUs)")
+    parser.add_argument("--max-upload", type=int, default=MAX_UPLOAD,
+                        help="tamanho máximo do corpo em bytes")
+    args = parser.parse_args(argv)
+
+    configurar_logs()
+    try:
+        servidor = criar_servidor(args.host, args.porta, args.processos, max_upload=args.max_upload)
+    except MemoriaInsuficiente as e:
+        parser.exit(1, f"❌ {e}\n")
+    print(f"🎵 Serviço de análise em http://{args.host}:{args.porta} ({args.processos} processo(s))")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servidor.fila.encerrar()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import numpy as np
+
+NOTAS = ['C', 'C#', 'D', 'D#', 'E', 'F',
+         'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# Perfis de Krumhansl-Kessler (C maior / C menor)
+PERFIL_MAIOR = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+PERFIL_MENOR = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+NOMES_TONALIDADES = [f"{n} maior" for n in NOTAS] + [f"{n} menor" for n in NOTAS]
+
+SR_RAPIDO = 11025
+HOP_RAPIDO = 512
+BLOCO_CQT = 30.0             # segundos de áudio por chroma_cqt (limita o pico de memória)
+MARGEM_CQT = 1.0             # contexto de cada lado: cobre os filtros mais longos do CQT
+
+# Linha do tempo de tonalidades (modulações)
+JANELA_TONALIDADE = 8.0      # segundos de chroma somados por janela
+PASSO_TONALIDADE = 2.0       # segundos entre o início de janelas consecutivas
+PENALIDADE_MUDANCA = 0.4     # custo (em correlação) de trocar de tom entre janelas no Viterbi
+
+# ----------------- PERFIS -----------------
+
+def _normalizar(x, axis=-1):
+    x = x - x.mean(axis=axis, keepdims=True)
+    norma = np.linalg.norm(x, axis=axis, keepdims=True)
+    return x / np.where(norma > 0, norma, 1)
+
+def _matriz_perfis():
+    # Linha k = perfil rotacionado para a tônica k (0-11 maiores, 12-23 menores)
+    rotacoes = (np.arange(12)[None, :] - np.arange(12)[:, None]) % 12
+    return _normalizar(np.vstack([PERFIL_MAIOR[rotacoes], PERFIL_MENOR[rotacoes]]))
+
+PERFIS = _matriz_perfis()
+
+# ----------------- FUNÇÕES -----------------
+
+def correlacionar_tonalidades(chroma):
+    # chroma (12,) -> (24,) ou (12, N) -> (24, N): correlação de Pearson com os 24 perfis
+    # num único produto de matrizes
+    return PERFIS @ _normalizar(np.asarray(chroma, dtype=float), axis=0)
+
+def estimar_tonalidade(chroma, top=3):
+    chroma = np.asarray(chroma)
+    if chroma.ndim == 2:
+        chroma = chroma.sum(axis=1)
+    scores = correlacionar_tonalidades(chroma)
+    melhores = np.argsort(scores)[::-1][:top]
+    return [(NOMES_TONALIDADES[i], round(float(scores[i]), 2)) for i in melhores]
+
+def correlacionar_janelas(chroma, frames_janela, frames_passo):
+    # Soma de chroma de cada janela por diferença de somas acumuladas (sem re-somar
+    # os frames de janelas sobrepostas) e todas as janelas contra os 24 perfis de uma vez
+    chroma = np.asarray(chroma, dtype=float)
+    n = chroma.shape[1]
+    frames_janela = max(1, min(frames_janela, n))
+    acumulado = np.concatenate([np.zeros((12, 1)), np.cumsum(chroma, axis=1)], axis=1)
+    inicios = np.arange(0, n - frames_janela + 1, max(1, frames_passo))
+    somas = acumulado[:, inicios + frames_janela] - acumulado[:, inicios]
+    return inicios, frames_janela, correlacionar_tonalidades(somas)
+
+def suavizar_viterbi(scores, penalidade=PENALIDADE_MUDANCA):
+    # Caminho de tonalidades (24 estados) que maximiza a soma das correlações menos
+    # `penalidade` a cada troca: descarta trocas de uma janela só
+    n_estados, n_janelas = scores.shape
+    acumulado = scores[:, 0].copy()
+    origem = np.zeros((n_estados, n_janelas), dtype=np.intp)
+    estados = np.arange(n_estados)
+    for t in range(1, n_janelas):
+        melhor = int(np.argmax(acumulado))
+        trocar = acumulado[melhor] - penalidade > acumulado
+        origem[:, t] = np.where(trocar, melhor, estados)
+        acumulado = np.where(trocar, acumulado[melhor] - penalidade, acumulado) + scores[:, t]
+    caminho = np.empty(n_janelas, dtype=np.intp)
+    caminho[-1] = int(np.argmax(acumulado))
+    for t in range(n_janelas - 1, 0, -1):
+        caminho[t - 1] = origem[caminho[t], t]
+    return caminho
+
+def linha_tonalidades(chroma, sr, hop_length, janela=JANELA_TONALIDADE, passo=PASSO_TONALIDADE,
+                      penalidade=PENALIDADE_MUDANCA):
+    # Trechos de tonalidade estável: [{"inicio", "fim", "tonalidade", "score"}, ...].
+    # Cada janela responde pelo intervalo em torno do seu centro; o primeiro trecho começa
+    # em 0 e o último termina no fim do chroma
+    n = np.asarray(chroma).shape[1]
+    if n == 0:
+        return []
+    por_segundo = sr / hop_length
+    inicios, frames_janela, scores = correlacionar_janelas(
+        chroma, int(round(janela * por_segundo)), int(round(passo * por_segundo)))
+    caminho = suavizar_viterbi(scores, penalidade)
+
+    centros = (inicios + frames_janela / 2) / por_segundo
+    limites = np.concatenate([[0.0], (centros[1:] + centros[:-1]) / 2, [n / por_segundo]])
+    mudancas = np.flatnonzero(np.diff(caminho)) + 1
+    cortes = np.concatenate([[0], mudancas, [len(caminho)]])
+    return [
+        {
+            "inicio": round(float(limites[a]), 2),
+            "fim": round(float(limites[b]), 2),
+            "tonalidade": NOMES_TONALIDADES[caminho[a]],
+            "score": round(float(scores[caminho[a], a:b].mean()), 2),
+        }
+        for a, b in zip(cortes[:-1], cortes[1:])
+    ]
+
+def chroma_rapido(y, sr, sr_alvo=SR_RAPIDO):
+    import librosa
+
+    # Chroma via STFT numa taxa reduzida: bem mais barato que o chroma_cqt
+    if sr != sr_alvo:
+        y = librosa.resample(y, orig_sr=sr, target_sr=sr_alvo, res_type="kaiser_fast")
+    return librosa.feature.chroma_stft(y=y, sr=sr_alvo, n_fft=2048, hop_length=HOP_RAPIDO)
+
+def chroma_cqt_em_blocos(y, sr, hop_length, bloco=BLOCO_CQT, margem=MARGEM_CQT):
+    import librosa
+
+    # chroma_cqt de trechos de `bloco` segundos com `margem` de contexto de cada lado,
+    # recortados na mesma grade de frames do sinal inteiro. O pico de memória do CQT
+    # (e da estimativa de afinação, feita uma vez só no primeiro trecho) não cresce com a
+    # janela analisada. Cada frame é normalizado sozinho, então os trechos se emendam.
+    frames_bloco = max(1, int(bloco * sr / hop_length))
+    margem = int(np.ceil(margem * sr / hop_length)) * hop_length
+    total = 1 + len(y) // hop_length
+    afinacao = librosa.estimate_tuning(y=y[:frames_bloco * hop_length], sr=sr, bins_per_octave=12)
+    partes = []
+    f0 = 0
+    while f0 < total:
+        f1 = f0 + frames_bloco
+        if total - f1 < frames_bloco // 2:
+            # Sobra curta vai junto com o trecho atual: um CQT de poucos frames avisa
+            # que o n_fft é grande demais e não tem contexto para as oitavas graves
+            f1 = total
+        inicio = max(0, f0 * hop_length - margem)
+        fim = min(len(y), (f1 - 1) * hop_length + margem)
+        chroma = librosa.feature.chroma_cqt(y=y[inicio:fim], sr=sr, hop_length=hop_length, tuning=afinacao)
+        partes.append(chroma[:, f0 - inicio // hop_length:f1 - inicio // hop_length])
+        f0 = f1
+    return np.concatenate(partes, axis=1)
+
+def formatar_tonalidade(tonalidades):
+    nome, score = tonalidades[0]
+    return f"{nome} ({score:.2f})"